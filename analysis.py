@@ -0,0 +1,79 @@
+import cv2
+import numpy as np
+import time
+from settings import ANALYSIS_SIZE, ANALYSIS_EQUALIZE, ANALYSIS_LOW_LIGHT_MEAN
+
+
+class AnalysisStage:
+    """Подготовка кадра к детекции (уменьшение и перевод в серое) в заранее выделенных буферах.
+
+    Буферы переиспользуются от кадра к кадру. Если OpenCV все же выделил
+    новый массив вместо записи в буфер, это учитывается в allocations —
+    в установившемся режиме счетчик не должен расти.
+    """
+
+    def __init__(self, size=ANALYSIS_SIZE, equalize=ANALYSIS_EQUALIZE, low_light_mean=ANALYSIS_LOW_LIGHT_MEAN):
+        self.size = size
+        self.equalize = equalize
+        self.low_light_mean = low_light_mean
+        width, height = size
+        self._small = np.empty((height, width, 3), np.uint8)
+        self._gray = np.empty((height, width), np.uint8)
+        self._equalized = np.empty((height, width), np.uint8)
+        self._source_gray = None
+        self.frames = 0
+        self.allocations = 0
+        self.total_time = 0.0
+        self.last_latency = 0.0
+
+    @property
+    def area(self):
+        return self.size[0] * self.size[1]
+
+    def _into(self, result, buffer):
+        if result is not buffer:
+            self.allocations += 1
+        return result
+
+    def _needs_equalize(self, gray):
+        if self.equalize == "on":
+            return True
+        if self.equalize == "auto":
+            return cv2.mean(gray)[0] < self.low_light_mean
+        return False
+
+    def process(self, frame):
+        """Серый кадр анализа; результат действителен до следующего вызова."""
+        start = time.perf_counter()
+        height, width = frame.shape[:2]
+
+        if (width, height) == self.size:
+            gray = self._into(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._gray), self._gray)
+        elif width * height > self.area:
+            # При уменьшении билинейная интерполяция читает лишь несколько исходных
+            # пикселей на выходной, поэтому цвет дешевле переводить уже в малом кадре
+            small = self._into(cv2.resize(frame, self.size, dst=self._small, interpolation=cv2.INTER_LINEAR),
+                               self._small)
+            gray = self._into(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=self._gray), self._gray)
+        else:
+            # При увеличении дешевле перевести в серое меньший исходный кадр
+            if self._source_gray is None or self._source_gray.shape != (height, width):
+                self._source_gray = np.empty((height, width), np.uint8)
+                self.allocations += 1
+            source_gray = self._into(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._source_gray),
+                                     self._source_gray)
+            gray = self._into(cv2.resize(source_gray, self.size, dst=self._gray, interpolation=cv2.INTER_LINEAR),
+                              self._gray)
+
+        if self._needs_equalize(gray):
+            gray = self._into(cv2.equalizeHist(gray, dst=self._equalized), self._equalized)
+
+        self.last_latency = time.perf_counter() - start
+        self.total_time += self.last_latency
+        self.frames += 1
+        return gray
+
+    def stats(self):
+        """Число кадров, выделений памяти и средняя задержка подготовки."""
+        mean_ms = self.total_time / self.frames * 1000 if self.frames else 0.0
+        return {"frames": self.frames, "allocations": self.allocations, "mean_ms": mean_ms}
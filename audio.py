@@ -0,0 +1,120 @@
+import io
+import logging
+import time
+import pygame
+from settings import AUDIO_FREQUENCY, AUDIO_CHANNELS, AUDIO_BUFFER
+
+
+class Clip:
+    """Декодированный фрагмент звука в памяти."""
+
+    def __init__(self, sound):
+        self.sound = sound
+        # Момент готовности фрагмента к воспроизведению — отсчет задержки
+        self.ready_at = time.perf_counter()
+
+    @property
+    def duration(self):
+        return self.sound.get_length()
+
+
+class AudioEngine:
+    """Звуковая подсистема: микшер открывается один раз при запуске.
+
+    Фрагменты речи декодируются из байтов в памяти (load можно вызывать из
+    рабочих потоков) и проигрываются на выделенном канале; следующий фрагмент
+    ставится в очередь канала, поэтому паузы между предложениями нет.
+    """
+
+    def __init__(self, frequency=AUDIO_FREQUENCY, channels=AUDIO_CHANNELS, buffer=AUDIO_BUFFER):
+        self.frequency = frequency
+        self.channels = channels
+        self.buffer = buffer
+        self.channel = None
+        self.plays = 0
+        self._latencies = []
+        # Последний момент, когда канал был занят: фрагмент, готовый раньше, ждал освобождения канала
+        self._busy_at = 0.0
+
+    @property
+    def started(self):
+        return self.channel is not None
+
+    def start(self):
+        """Открытие микшера; вызывается до pygame.init, иначе он откроется с настройками по умолчанию."""
+        if self.started:
+            return True
+        try:
+            pygame.mixer.pre_init(self.frequency, -16, self.channels, self.buffer)
+            pygame.mixer.init()
+            pygame.mixer.set_reserved(1)
+            self.channel = pygame.mixer.Channel(0)
+        except pygame.error as e:
+            logging.error(f"Ошибка инициализации аудио: {str(e)}")
+            return False
+        frequency, _, channels = pygame.mixer.get_init()
+        # Фактические параметры устройства могут отличаться от запрошенных
+        self.frequency = frequency
+        logging.info(f"Аудио инициализировано: {frequency} Гц, каналов {channels}, буфер {self.buffer}")
+        return True
+
+    def output_latency(self):
+        """Задержка вывода устройства: один буфер микшера (с)."""
+        return self.buffer / self.frequency
+
+    def load(self, data):
+        """Декодирование фрагмента (MP3/OGG/WAV) из байтов без временного файла."""
+        return Clip(pygame.mixer.Sound(file=io.BytesIO(data)))
+
+    def _channel_busy(self):
+        if self.channel.get_busy():
+            self._busy_at = time.perf_counter()
+            return True
+        return False
+
+    def can_enqueue(self):
+        """Канал свободен или в его очереди нет следующего фрагмента."""
+        return self.started and (not self._channel_busy() or self.channel.get_queue() is None)
+
+    def enqueue(self, clip):
+        """Воспроизведение фрагмента сразу или после текущего."""
+        if self._channel_busy():
+            self.channel.queue(clip.sound)
+            return
+        requested = max(clip.ready_at, self._busy_at)
+        self.channel.play(clip.sound)
+        # SDL забирает звук при следующем запросе буфера устройства, поэтому первый
+        # сэмпл выходит не позже чем через один буфер после запуска канала
+        latency = time.perf_counter() - requested + self.output_latency()
+        self.plays += 1
+        self._latencies.append(latency)
+        logging.info(f"Задержка до первого сэмпла: {latency * 1000:.1f} мс")
+
+    def busy(self):
+        return self.started and self._channel_busy()
+
+    def stop(self):
+        """Остановка воспроизведения; микшер остается открытым."""
+        if self.started:
+            self.channel.stop()
+
+    def close(self):
+        if self.started:
+            self.channel.stop()
+            pygame.mixer.quit()
+            self.channel = None
+
+    def stats(self):
+        """Задержка от запроса воспроизведения до первого сэмпла: средняя и максимальная (мс)."""
+        latencies, self._latencies = self._latencies, []
+        if not latencies:
+            return {"plays": self.plays, "latency_ms": 0.0, "latency_max_ms": 0.0}
+        return {
+            "plays": self.plays,
+            "latency_ms": sum(latencies) / len(latencies) * 1000,
+            "latency_max_ms": max(latencies) * 1000,
+        }
+
+
+# Общий экземпляр: микшер на все время работы программы
+audio_engine = AudioEngine()
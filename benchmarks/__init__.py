@@ -0,0 +1 @@
+"""Бенчмарки подсистем киоска. Запуск из корня репозитория: python -m benchmarks.<имя>."""
@@ -0,0 +1,135 @@
+"""Сравнение бэкендов детектора лиц по задержке и полноте на одних и тех же кадрах.
+
+Кадры берутся из каталога с изображениями или из видеофайла. Разметка
+(необязательная) — JSON вида {"имя_файла или номер_кадра": [[x, y, w, h], ...]}
+в координатах исходного кадра. Без разметки вместо полноты выводится доля
+кадров, на которых найдено хотя бы одно лицо.
+
+    python -m benchmarks.detectors frames/ --labels labels.json --backends haar lbp dnn
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+import cv2
+
+from detector import BACKENDS, create_detector
+from settings import ANALYSIS_SIZE
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+
+def load_frames(path, max_frames):
+    """Загрузка кадров: список (ключ разметки, кадр BGR)."""
+    frames = []
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                frame = cv2.imread(os.path.join(path, name))
+                if frame is not None:
+                    frames.append((name, frame))
+            if len(frames) >= max_frames:
+                break
+    else:
+        cap = cv2.VideoCapture(path)
+        index = 0
+        while len(frames) < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append((str(index), frame))
+            index += 1
+        cap.release()
+    return frames
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union else 0.0
+
+
+def prepare(frames, labels):
+    """Перевод кадров в серое 640x480 и разметки в координаты анализа, как в create_face."""
+    prepared = []
+    for key, frame in frames:
+        scale_x = ANALYSIS_SIZE[0] / frame.shape[1]
+        scale_y = ANALYSIS_SIZE[1] / frame.shape[0]
+        gray = cv2.cvtColor(cv2.resize(frame, ANALYSIS_SIZE), cv2.COLOR_BGR2GRAY)
+        boxes = None
+        if labels is not None:
+            boxes = [(x * scale_x, y * scale_y, w * scale_x, h * scale_y) for x, y, w, h in labels.get(key, [])]
+        prepared.append((gray, boxes))
+    return prepared
+
+
+def run_backend(detector, prepared, repeat, iou_threshold):
+    latencies = []
+    found_frames = 0
+    matched = 0
+    expected = 0
+    for gray, boxes in prepared:
+        faces = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            faces = detector.detect(gray)
+            latencies.append((time.perf_counter() - start) * 1000)
+        if faces:
+            found_frames += 1
+        if boxes is not None:
+            expected += len(boxes)
+            matched += sum(1 for box in boxes if any(iou(box, face) >= iou_threshold for face in faces))
+
+    latencies.sort()
+    result = {
+        "mean_ms": statistics.mean(latencies),
+        "p50_ms": latencies[len(latencies) // 2],
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "detection_rate": found_frames / len(prepared),
+    }
+    if expected:
+        result["recall"] = matched / expected
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение бэкендов детектора лиц")
+    parser.add_argument("frames", help="каталог с изображениями или видеофайл")
+    parser.add_argument("--labels", help="JSON с разметкой лиц")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--max-frames", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3, help="повторов детекции на кадр")
+    parser.add_argument("--iou", type=float, default=0.5, help="порог IoU для засчитывания лица")
+    args = parser.parse_args()
+
+    labels = None
+    if args.labels:
+        with open(args.labels, encoding="utf-8") as f:
+            labels = json.load(f)
+
+    frames = load_frames(args.frames, args.max_frames)
+    if not frames:
+        raise SystemExit(f"Нет кадров: {args.frames}")
+    prepared = prepare(frames, labels)
+    print(f"Кадров: {len(prepared)}, разрешение анализа: {ANALYSIS_SIZE[0]}x{ANALYSIS_SIZE[1]}")
+
+    for backend in args.backends:
+        try:
+            detector = create_detector(backend)
+        except Exception as e:
+            print(f"{backend:>5}: пропущен ({e})")
+            continue
+        result = run_backend(detector, prepared, args.repeat, args.iou)
+        recall = f"{result['recall']:.3f}" if "recall" in result else "—"
+        print(f"{backend:>5}: mean {result['mean_ms']:.2f} ms, p50 {result['p50_ms']:.2f} ms, "
+              f"p95 {result['p95_ms']:.2f} ms, detection rate {result['detection_rate']:.3f}, recall {recall}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""Нагрузочный прогон полного цикла киоска без экрана, камеры и удаленного API.
+
+Запускает main.main() с фиктивными видео- и аудиодрайверами SDL, источником
+кадров из видеофайла (по кругу) или синтетическим лицом и заглушкой API
+досье с настраиваемыми задержкой, разбросом, долей ошибок и размером
+ответа. Каждые --sample-every циклов снимаются пропускная способность,
+хвосты задержек, память процесса, открытые файловые дескрипторы, потоки и
+живые поверхности pygame; рост между первым и последним замером —
+признак утечки.
+
+    python -m benchmarks.load --image faces/face.jpg --cycles 2000 --latency 1.5 --jitter 0.5 \\
+        --failure-rate 0.05 --output results/load.json
+
+Продолжительность цикла определяется PHOTO_DELAY, TEXT_SPEED и
+DOSSIER_DISPLAY_DURATION из config; для длинных прогонов их стоит уменьшить.
+"""
+import os
+
+# Драйверы SDL выбираются при pygame.init, поэтому до импорта main
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import asyncio
+import gc
+import io
+import json
+import random
+import resource
+import threading
+import time
+import wave
+from datetime import datetime
+
+import pygame
+
+import dossier_cache
+import dossier_stream
+import main
+import tts
+from benchmarks.replay import ReplayCapture, SyntheticCapture, git_revision, percentile
+
+WORDS = ("объект", "наблюдения", "проживает", "в", "городе", "работает", "инженером", "увлекается", "шахматами",
+         "имеет", "собаку", "посещает", "спортзал", "по", "вторникам", "предпочитает", "черный", "кофе")
+
+
+class MockDossierAPI:
+    """Заглушка api_client: get_dossier и stream_dossier с имитацией сети."""
+
+    def __init__(self, latency=1.0, jitter=0.3, failure_rate=0.0, size=1500, chunks=8, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.size = size
+        self.chunks = chunks
+        self._random = random.Random(seed)
+        self.requests = 0
+        self.failures = 0
+        self.latencies = []
+
+    def _text(self):
+        sentences = []
+        length = 0
+        while length < self.size:
+            words = [self._random.choice(WORDS) for _ in range(self._random.randint(5, 14))]
+            sentence = " ".join(words).capitalize() + "."
+            sentences.append(sentence)
+            length += len(sentence) + 1
+            if self._random.random() < 0.25:
+                sentences.append("\n")
+        return " ".join(sentences)
+
+    async def _respond(self, photo_path):
+        self.requests += 1
+        # Как настоящий клиент, читаем файл снимка
+        with open(photo_path, "rb") as f:
+            f.read()
+        delay = max(0.0, self._random.gauss(self.latency, self.jitter))
+        if self._random.random() < self.failure_rate:
+            await asyncio.sleep(delay)
+            self.failures += 1
+            raise Exception("Имитация ошибки API")
+        return delay, self._text(), self.requests
+
+    async def get_dossier(self, photo_path, api_key, api_scope):
+        start = time.perf_counter()
+        delay, text, number = await self._respond(photo_path)
+        await asyncio.sleep(delay)
+        self.latencies.append(time.perf_counter() - start)
+        return text, number
+
+    async def stream_dossier(self, photo_path, api_key, api_scope):
+        start = time.perf_counter()
+        delay, text, number = await self._respond(photo_path)
+        # Половина задержки до первого фрагмента, остальное — на передачу
+        await asyncio.sleep(delay / 2)
+        step = max(1, len(text) // self.chunks)
+        for offset in range(0, len(text), step):
+            yield text[offset:offset + step], number if offset == 0 else None
+            await asyncio.sleep(delay / 2 / self.chunks)
+        self.latencies.append(time.perf_counter() - start)
+
+
+def silence_wav(seconds=0.3, rate=24000):
+    """Короткая тишина в WAV для заглушки синтеза речи."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(b"\0\0" * int(seconds * rate))
+    return buffer.getvalue()
+
+
+def rss_bytes():
+    """Текущий размер резидентной памяти; без /proc — пиковый."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def open_fds():
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+def live_surfaces():
+    return sum(1 for obj in gc.get_objects() if isinstance(obj, pygame.Surface))
+
+
+class LoadRecorder:
+    """Сбор исходов и длительностей циклов и периодических замеров ресурсов."""
+
+    def __init__(self, api, sample_every):
+        self.api = api
+        self.sample_every = sample_every
+        self.start = time.perf_counter()
+        self.durations = []
+        self.outcomes = {}
+        self.samples = []
+
+    def on_cycle(self, outcome, duration):
+        self.durations.append(duration)
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        if len(self.durations) % self.sample_every == 0:
+            self.sample()
+
+    def sample(self):
+        window = self.durations[-self.sample_every:]
+        sample = {
+            "cycle": len(self.durations),
+            "elapsed_s": time.perf_counter() - self.start,
+            "cycles_per_min": len(window) / sum(window) * 60 if window else 0.0,
+            "cycle_p99_s": percentile(window, 0.99) if window else None,
+            "api_p99_s": percentile(self.api.latencies[-self.sample_every:], 0.99) if self.api.latencies else None,
+            "rss_mb": rss_bytes() / 1024 / 1024,
+            "open_fds": open_fds(),
+            "threads": threading.active_count(),
+            "surfaces": live_surfaces(),
+        }
+        self.samples.append(sample)
+        print(f"[{sample['cycle']:>6}] {sample['cycles_per_min']:.1f} циклов/мин, "
+              f"p99 цикла {sample['cycle_p99_s'] or 0:.2f} с, RSS {sample['rss_mb']:.1f} МБ, "
+              f"fd {sample['open_fds']}, потоков {sample['threads']}, поверхностей {sample['surfaces']}")
+
+    def report(self):
+        durations = self.durations
+        growth = {}
+        if len(self.samples) >= 2:
+            first, last = self.samples[0], self.samples[-1]
+            cycles = last["cycle"] - first["cycle"]
+            for key in ("rss_mb", "open_fds", "threads", "surfaces"):
+                if first[key] is not None and last[key] is not None:
+                    # Рост на 1000 циклов после первого замера (прогрев кэшей не учитывается)
+                    growth[key] = (last[key] - first[key]) / cycles * 1000 if cycles else 0.0
+        return {
+            "cycles": len(durations),
+            "outcomes": self.outcomes,
+            "throughput_cycles_per_min": len(durations) / (time.perf_counter() - self.start) * 60,
+            "cycle_p50_s": percentile(durations, 0.5) if durations else None,
+            "cycle_p95_s": percentile(durations, 0.95) if durations else None,
+            "cycle_p99_s": percentile(durations, 0.99) if durations else None,
+            "api_requests": self.api.requests,
+            "api_failures": self.api.failures,
+            "api_p99_s": percentile(self.api.latencies, 0.99) if self.api.latencies else None,
+            "growth_per_1000_cycles": growth,
+            "samples": self.samples,
+        }
+
+
+def main_load():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон цикла киоска без экрана")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--video", help="видеофайл, воспроизводимый по кругу")
+    source.add_argument("--image", help="изображение лица для синтетического источника")
+    parser.add_argument("--cycles", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=1.0, help="средняя задержка API, с")
+    parser.add_argument("--jitter", type=float, default=0.3, help="разброс задержки API, с")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="доля ответов API с ошибкой")
+    parser.add_argument("--size", type=int, default=1500, help="размер досье, символов")
+    parser.add_argument("--no-stream", action="store_true", help="только get_dossier, без stream_dossier")
+    parser.add_argument("--dossier-cache", action="store_true",
+                        help="включить кэш досье (по умолчанию выключен: одно и то же лицо не дошло бы до API)")
+    parser.add_argument("--sample-every", type=int, default=50, help="циклов между замерами ресурсов")
+    parser.add_argument("--output", help="файл для результатов в JSON")
+    args = parser.parse_args()
+
+    api = MockDossierAPI(args.latency, args.jitter, args.failure_rate, args.size)
+    if args.no_stream:
+        api.stream_dossier = None
+    dossier_stream.use_client(api)
+    dossier_cache.use_cache(dossier_cache.DossierCache() if args.dossier_cache else None)
+    tts.use_synthesizer(tts.SpeechSynthesizer(backend=tts.StubBackend(silence_wav())))
+
+    if args.video:
+        camera_source = ReplayCapture(args.video, realtime=True, loop=True)
+    else:
+        # Лицо в кадре все время: каждый цикл заканчивается снимком
+        camera_source = SyntheticCapture(image=args.image, duration=10 ** 7, present=(0, 10 ** 7), realtime=True)
+
+    recorder = LoadRecorder(api, args.sample_every)
+    asyncio.run(main.main(sources=[camera_source], max_cycles=args.cycles, on_cycle=recorder.on_cycle))
+    recorder.sample()
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "config": {
+            "source": args.video or "synthetic",
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "failure_rate": args.failure_rate,
+            "size": args.size,
+            "stream": not args.no_stream,
+            "dossier_cache": args.dossier_cache,
+        },
+        "result": recorder.report(),
+    }
+    result = report["result"]
+    print(f"Циклов: {result['cycles']}, исходы: {result['outcomes']}, "
+          f"{result['throughput_cycles_per_min']:.1f} циклов/мин, p99 цикла {result['cycle_p99_s'] or 0:.2f} с")
+    print(f"Рост на 1000 циклов: {result['growth_per_1000_cycles']}")
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результаты записаны в {args.output}")
+
+
+if __name__ == "__main__":
+    main_load()
@@ -0,0 +1,380 @@
+"""Воспроизведение записанных и синтетических роликов через конвейер захвата и детекции без камеры и экрана.
+
+Набор роликов описывается JSON-файлом:
+
+    {"clips": [
+        {"name": "walkup", "source": "clips/walkup.mp4", "trigger": true, "face_from": 1.2},
+        {"name": "empty", "source": "clips/empty_hall.mp4", "trigger": false},
+        {"name": "synth", "synthetic": {"image": "faces/face.jpg", "duration": 8, "present": [1.0, 6.0]}}
+    ]}
+
+trigger — должен ли ролик привести к снимку, face_from — секунда ролика,
+с которой в кадре стоит человек (снимок раньше считается ложным).
+Синтетический ролик — шумовой фон, на который в интервале present
+вставляется изображение лица с небольшим смещением; без image лица нет
+вовсе. Разметка синтетического ролика выводится из present и PHOTO_DELAY.
+
+Режим по умолчанию прогоняет кадры без пауз и считает время по ролику,
+в том числе для детектора движения и пропуска кадров в простое: момент
+снимка воспроизводим и не зависит от скорости машины (задержки детекции,
+конечно, зависят). С --realtime
+ролик отдается с его частотой кадров через CameraSession и capture_first,
+как с живой камерой.
+
+    python -m benchmarks.replay clips.json --output results/replay.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from camera import CameraSession, FacePipeline, capture_first, init_camera
+from config import FRAME_SKIP, PHOTO_DELAY
+from detector import BACKENDS, create_detector
+from settings import DETECTOR_BACKEND, ANALYSIS_SIZE, MOTION_GATE_ENABLED, TRACKING_ENABLED
+
+
+class ReplayCapture:
+    """Видеофайл с интерфейсом cv2.VideoCapture.
+
+    В режиме realtime кадры отдаются с частотой ролика, с loop — по кругу.
+    """
+
+    def __init__(self, path, realtime=False, loop=False):
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+        self._cap = cv2.VideoCapture(path)
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS) or 25.0
+        self._next_time = None
+
+    def isOpened(self):
+        return self._cap.isOpened()
+
+    def get(self, prop):
+        return self._cap.get(prop)
+
+    def read(self):
+        if self.realtime:
+            now = time.perf_counter()
+            if self._next_time is None:
+                self._next_time = now
+            elif self._next_time > now:
+                time.sleep(self._next_time - now)
+            self._next_time += 1 / self.fps
+        ret, frame = self._cap.read()
+        if not ret and self.loop:
+            # Бесконечное воспроизведение для длительных прогонов
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self._cap.read()
+        return ret, frame
+
+    def release(self):
+        self._cap.release()
+
+    def __str__(self):
+        return self.path
+
+
+class SyntheticCapture:
+    """Синтетическая последовательность кадров с интерфейсом cv2.VideoCapture."""
+
+    def __init__(self, image=None, size=(1280, 720), fps=25.0, duration=8.0, present=None, realtime=False,
+                 seed=0):
+        self.size = size
+        self.fps = fps
+        self.frame_count = int(duration * fps)
+        self.present = present
+        self.realtime = realtime
+        self._index = 0
+        self._next_time = None
+        self._random = np.random.default_rng(seed)
+        self._face = None
+        if image is not None:
+            face = cv2.imread(image)
+            if face is None:
+                raise Exception(f"Не удалось прочитать изображение: {image}")
+            # Лицо занимает около половины высоты кадра
+            scale = size[1] * 0.5 / face.shape[0]
+            self._face = cv2.resize(face, (int(face.shape[1] * scale), int(face.shape[0] * scale)))
+        self._background = self._random.integers(40, 80, (size[1], size[0], 3), dtype=np.uint8)
+
+    def isOpened(self):
+        return True
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.size[0])
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.size[1])
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        return 0.0
+
+    def face_visible(self, t):
+        return self._face is not None and self.present is not None and self.present[0] <= t < self.present[1]
+
+    def read(self):
+        if self._index >= self.frame_count:
+            return False, None
+        if self.realtime:
+            now = time.perf_counter()
+            if self._next_time is None:
+                self._next_time = now
+            elif self._next_time > now:
+                time.sleep(self._next_time - now)
+            self._next_time += 1 / self.fps
+        t = self._index / self.fps
+        self._index += 1
+        frame = self._background.copy()
+        # Шум сенсора, чтобы кадры не были побайтно одинаковыми
+        frame += self._random.integers(0, 4, frame.shape, dtype=np.uint8)
+        if self.face_visible(t):
+            h, w = self._face.shape[:2]
+            # Небольшое покачивание, как у стоящего перед камерой человека
+            x = (self.size[0] - w) // 2 + int(6 * np.sin(t * 2.0))
+            y = (self.size[1] - h) // 2 + int(4 * np.cos(t * 1.5))
+            frame[y:y + h, x:x + w] = self._face
+        return True, frame
+
+    def release(self):
+        pass
+
+    def __str__(self):
+        return "synthetic"
+
+
+class RecordingPipeline(FacePipeline):
+    """Конвейер анализа, запоминающий время каждого анализа кадра."""
+
+    def __init__(self, name, detector, clock=time.monotonic):
+        super().__init__(name, detector, clock)
+        self.latencies = []
+
+    def analyze(self, original_frame):
+        start = time.perf_counter()
+        try:
+            return super().analyze(original_frame)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+
+class _LatestFrame:
+    """Буфер одного кадра для FacePipeline.next_frame, как у CaptureWorker."""
+
+    def __init__(self, frame):
+        self.frame = frame
+
+    def read(self):
+        return True, self.frame
+
+
+class ClipClock:
+    """Время ролика (секунды) для детектора движения; run_fast сдвигает его с каждым кадром."""
+
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+def open_clip(clip, realtime):
+    """Источник и разметка ролика: (источник, должен ли быть снимок, секунда появления лица)."""
+    if "synthetic" in clip:
+        spec = dict(clip["synthetic"])
+        present = spec.get("present")
+        source = SyntheticCapture(image=spec.get("image"), size=tuple(spec.get("size", (1280, 720))),
+                                  fps=spec.get("fps", 25.0), duration=spec.get("duration", 8.0),
+                                  present=tuple(present) if present else None, realtime=realtime)
+        expected = bool(spec.get("image") and present and present[1] - present[0] > PHOTO_DELAY)
+        face_from = present[0] if present else None
+        return source, clip.get("trigger", expected), clip.get("face_from", face_from)
+    return ReplayCapture(clip["source"], realtime), clip.get("trigger", False), clip.get("face_from")
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_fast(source, pipeline, clock):
+    """Кадры без пауз, время — по ролику; правило снимка то же, что в capture_with_delay.
+
+    clock — часы ролика, которыми пользуется детектор движения конвейера.
+    """
+    cap = init_camera(source)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    pipeline.reset()
+    # Кадр 0 уже прочитан init_camera для проверки источника
+    index = 1
+    start_time = None
+    trigger_time = None
+    wall_start = time.perf_counter()
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        t = index / fps
+        index += 1
+        clock.t = t
+        frame = pipeline.next_frame(_LatestFrame(frame))
+        if frame is None:
+            continue
+        _, detected, _ = pipeline.analyze(frame)
+        if not detected:
+            start_time = None
+        elif start_time is None:
+            start_time = t
+        elif t - start_time >= PHOTO_DELAY:
+            trigger_time = t
+            break
+    cap.release()
+    return trigger_time, time.perf_counter() - wall_start, index / fps
+
+
+async def _capture_realtime(source, pipeline, timeout):
+    session = CameraSession(source).start()
+    start = time.perf_counter()
+    try:
+        photo = await asyncio.wait_for(capture_first([(session, pipeline)]), timeout)
+    except asyncio.TimeoutError:
+        photo = None
+    finally:
+        session.release()
+    elapsed = time.perf_counter() - start
+    return (elapsed if photo is not None else None), elapsed
+
+
+def run_realtime(source, pipeline, duration):
+    """Ролик с его частотой кадров через CameraSession и capture_first; время — по часам."""
+    trigger_time, elapsed = asyncio.run(_capture_realtime(source, pipeline, duration + 1.0))
+    return trigger_time, elapsed, duration
+
+
+def run_clip(clip, detector, realtime):
+    source, expected, face_from = open_clip(clip, realtime)
+    duration = (source.frame_count / source.fps) if isinstance(source, SyntheticCapture) else \
+        source.get(cv2.CAP_PROP_FRAME_COUNT) / source.fps
+    if realtime:
+        pipeline = RecordingPipeline(clip.get("name", "clip"), detector)
+        trigger_time, wall, clip_time = run_realtime(source, pipeline, duration)
+    else:
+        clock = ClipClock()
+        pipeline = RecordingPipeline(clip.get("name", "clip"), detector, clock)
+        trigger_time, wall, clip_time = run_fast(source, pipeline, clock)
+
+    triggered = trigger_time is not None
+    latencies = [value * 1000 for value in pipeline.latencies]
+    result = {
+        "name": clip.get("name", str(source)),
+        "expected_trigger": expected,
+        "triggered": triggered,
+        "trigger_time_s": trigger_time,
+        "time_to_trigger_s": (trigger_time - face_from) if triggered and face_from is not None else trigger_time,
+        "false_trigger": triggered and (not expected or (face_from is not None and trigger_time < face_from)),
+        "missed_trigger": expected and not triggered,
+        "frames_analyzed": len(latencies),
+        "analysis_fps": len(latencies) / sum(pipeline.latencies) if latencies else 0.0,
+        "realtime_factor": clip_time / wall if wall else 0.0,
+    }
+    if latencies:
+        result.update({
+            "detect_p50_ms": percentile(latencies, 0.5),
+            "detect_p90_ms": percentile(latencies, 0.9),
+            "detect_p99_ms": percentile(latencies, 0.99),
+            "detect_max_ms": max(latencies),
+        })
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(results):
+    latencies = [r["detect_p50_ms"] for r in results if "detect_p50_ms" in r]
+    triggered = [r["time_to_trigger_s"] for r in results if r["triggered"] and not r["false_trigger"]]
+    return {
+        "clips": len(results),
+        "false_triggers": sum(r["false_trigger"] for r in results),
+        "missed_triggers": sum(r["missed_trigger"] for r in results),
+        "mean_time_to_trigger_s": sum(triggered) / len(triggered) if triggered else None,
+        "median_detect_p50_ms": percentile(latencies, 0.5) if latencies else None,
+        "mean_analysis_fps": sum(r["analysis_fps"] for r in results) / len(results) if results else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк захвата и детекции на записанных роликах")
+    parser.add_argument("clips", help="JSON с описанием роликов")
+    parser.add_argument("--backend", default=DETECTOR_BACKEND, choices=list(BACKENDS))
+    parser.add_argument("--realtime", action="store_true", help="отдавать кадры с частотой ролика")
+    parser.add_argument("--output", help="файл для результатов в JSON")
+    args = parser.parse_args()
+
+    with open(args.clips, encoding="utf-8") as f:
+        clips = json.load(f)["clips"]
+    base = os.path.dirname(os.path.abspath(args.clips))
+    for clip in clips:
+        # Пути в описании — относительно файла описания
+        if "source" in clip:
+            clip["source"] = os.path.join(base, clip["source"])
+        if clip.get("synthetic", {}).get("image"):
+            clip["synthetic"]["image"] = os.path.join(base, clip["synthetic"]["image"])
+
+    detector = create_detector(args.backend)
+    results = []
+    for clip in clips:
+        result = run_clip(clip, detector, args.realtime)
+        results.append(result)
+        ttt = f"{result['time_to_trigger_s']:.2f} s" if result["time_to_trigger_s"] is not None else "—"
+        flag = "ЛОЖНЫЙ" if result["false_trigger"] else "ПРОПУСК" if result["missed_trigger"] else "ok"
+        print(f"{result['name']:>16}: {result['analysis_fps']:.1f} FPS, "
+              f"p50 {result.get('detect_p50_ms', 0.0):.2f} ms, p99 {result.get('detect_p99_ms', 0.0):.2f} ms, "
+              f"снимок {ttt}, {flag}")
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "host": {
+            "node": platform.node(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+        },
+        "config": {
+            "backend": args.backend,
+            "mode": "realtime" if args.realtime else "fast",
+            "frame_skip": FRAME_SKIP,
+            "photo_delay": PHOTO_DELAY,
+            "analysis_size": list(ANALYSIS_SIZE),
+            "motion_gate": MOTION_GATE_ENABLED,
+            "tracking": TRACKING_ENABLED,
+        },
+        "clips": results,
+        "summary": summarize(results),
+    }
+    summary = report["summary"]
+    print(f"Ложных снимков: {summary['false_triggers']}, пропущенных: {summary['missed_triggers']}")
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результаты записаны в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Сравнение полного поиска каскада с поиском, ограниченным порогом MIN_AREA_PERCENT.
+
+Для каждого каскадного бэкенда измеряется задержка detect в исходной
+настройке (minSize 30x30, без maxSize и уменьшения) и с границами из
+detector.size_limits. Проверяется, что все лица, проходящие порог площади
+при полном поиске, находятся и при ограниченном (совпадение по IoU), и что
+решение «есть подходящее лицо» на каждом кадре не меняется.
+
+    python -m benchmarks.size_pruning frames/ --min-area 0.1
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.detectors import iou, load_frames, prepare
+from config import MIN_AREA_PERCENT
+from detector import BACKENDS, create_detector, size_limits
+from settings import ANALYSIS_SIZE
+
+
+def measure(detector, prepared, repeat):
+    latencies = []
+    results = []
+    for gray, _ in prepared:
+        faces = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            faces = detector.detect(gray)
+            latencies.append((time.perf_counter() - start) * 1000)
+        results.append(faces)
+    latencies.sort()
+    return {
+        "mean_ms": statistics.mean(latencies),
+        "p50_ms": latencies[len(latencies) // 2],
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+    }, results
+
+
+def qualifying(faces, frame_area, min_area):
+    return [face for face in faces if face[2] * face[3] / frame_area >= min_area]
+
+
+def compare(full_results, pruned_results, frame_area, min_area, iou_threshold):
+    """Потерянные подходящие лица и кадры, на которых изменилось решение о снимке."""
+    expected = 0
+    lost = 0
+    changed = 0
+    for full, pruned in zip(full_results, pruned_results):
+        full_ok = qualifying(full, frame_area, min_area)
+        pruned_ok = qualifying(pruned, frame_area, min_area)
+        expected += len(full_ok)
+        lost += sum(1 for face in full_ok if not any(iou(face, other) >= iou_threshold for other in pruned))
+        if bool(full_ok) != bool(pruned_ok):
+            changed += 1
+    return expected, lost, changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ускорение каскада за счет границ размера лица")
+    parser.add_argument("frames", help="каталог с изображениями или видеофайл")
+    parser.add_argument("--min-area", type=float, default=MIN_AREA_PERCENT, help="порог площади лица")
+    parser.add_argument("--max-frames", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3, help="повторов детекции на кадр")
+    parser.add_argument("--iou", type=float, default=0.5, help="порог IoU для совпадения лиц")
+    args = parser.parse_args()
+
+    frames = load_frames(args.frames, args.max_frames)
+    if not frames:
+        raise SystemExit(f"Нет кадров: {args.frames}")
+    prepared = prepare(frames, None)
+    frame_area = ANALYSIS_SIZE[0] * ANALYSIS_SIZE[1]
+    limits = size_limits(ANALYSIS_SIZE, args.min_area)
+    print(f"Кадров: {len(prepared)}, порог площади {args.min_area:.3f}, minSize {limits['min_size']}, "
+          f"maxSize {limits['max_size']}, уменьшение поиска {limits['search_scale']:.2f}")
+
+    for backend, cls in BACKENDS.items():
+        if not getattr(cls, "supports_size_limits", False):
+            continue
+        try:
+            full = create_detector(backend, min_size=(30, 30))
+            pruned = create_detector(backend, **limits)
+        except Exception as e:
+            print(f"{backend:>5}: пропущен ({e})")
+            continue
+        full_stats, full_results = measure(full, prepared, args.repeat)
+        pruned_stats, pruned_results = measure(pruned, prepared, args.repeat)
+        expected, lost, changed = compare(full_results, pruned_results, frame_area, args.min_area, args.iou)
+        speedup = full_stats["mean_ms"] / pruned_stats["mean_ms"] if pruned_stats["mean_ms"] else 0.0
+        print(f"{backend:>5}: полный поиск {full_stats['mean_ms']:.2f} ms (p95 {full_stats['p95_ms']:.2f}), "
+              f"ограниченный {pruned_stats['mean_ms']:.2f} ms (p95 {pruned_stats['p95_ms']:.2f}), "
+              f"ускорение x{speedup:.1f}; подходящих лиц {expected}, потеряно {lost}, "
+              f"кадров с другим решением {changed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Микробенчмарк переноса текста: исходный wrap_text против TextLayout.
+
+Запускается без дисплея (SDL dummy), текст по умолчанию — синтетическое
+досье; можно передать свой файл.
+
+    python -m benchmarks.text_layout --repeat 50 --width 900
+"""
+import argparse
+import os
+import statistics
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame
+
+from text_layout import TextLayout
+
+SAMPLE_PARAGRAPH = ("Субъект замечен у входа в здание в хорошем настроении. По данным наблюдения, "
+                    "предпочитает кофе без сахара, носит удобную обувь и уверенно пользуется лифтом. "
+                    "Рекомендуется вежливое обращение и своевременная выдача пропуска.")
+
+
+def legacy_wrap_text(text, font, max_width):
+    """Исходная реализация display.wrap_text: растеризация каждого растущего префикса строки."""
+    lines = []
+    for paragraph in text.split('\n'):
+        if not paragraph:
+            lines.append("")
+            continue
+        words = paragraph.split(" ")
+        current_line = ""
+        for word in words:
+            test_line = f"{current_line}{word} "
+            test_surface = font.render(test_line.strip(), True, (255, 255, 255))
+            if test_surface.get_width() <= max_width:
+                current_line = test_line
+            else:
+                if current_line:
+                    lines.append(current_line.strip())
+                current_line = f"{word} "
+        if current_line:
+            lines.append(current_line.strip())
+
+    surfaces = []
+    for line in lines:
+        if line:
+            surfaces.append(font.render(line, True, (255, 255, 255)))
+        else:
+            surfaces.append(None)
+    return surfaces
+
+
+def timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение реализаций переноса текста")
+    parser.add_argument("--text", help="файл с текстом досье")
+    parser.add_argument("--paragraphs", type=int, default=12)
+    parser.add_argument("--width", type=int, default=900, help="ширина колонки текста, px")
+    parser.add_argument("--font-size", type=int, default=36)
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+
+    if args.text:
+        with open(args.text, encoding="utf-8") as f:
+            text = f.read()
+    else:
+        text = "\n".join([SAMPLE_PARAGRAPH] * args.paragraphs)
+
+    pygame.init()
+    font = pygame.font.SysFont("arial", args.font_size)
+
+    legacy_lines = [s.get_width() if s else 0 for s in legacy_wrap_text(text, font, args.width)]
+    new_lines = TextLayout().wrap_lines(text, font, args.width)
+    print(f"Символов: {len(text)}, строк: исходно {len(legacy_lines)}, новая раскладка {len(new_lines)}")
+
+    results = {
+        "legacy wrap_text": timed(lambda: legacy_wrap_text(text, font, args.width), args.repeat),
+        # Холодный кэш: новый экземпляр на каждый прогон
+        "TextLayout (cold)": timed(lambda: TextLayout().wrap(text, font, args.width), args.repeat),
+    }
+    warm = TextLayout()
+    warm.wrap(text, font, args.width)
+    results["TextLayout (warm)"] = timed(lambda: warm.wrap(text, font, args.width), args.repeat)
+    results["layout only (warm)"] = timed(lambda: warm.wrap_lines(text, font, args.width), args.repeat)
+
+    for name, (median, worst) in results.items():
+        print(f"{name:>20}: median {median:.3f} ms, max {worst:.3f} ms")
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import cv2
+import time
+import metrics
+from settings import BEST_FRAME_SLOTS, BEST_FRAME_WINDOW, BEST_FRAME_WEIGHTS, BEST_FRAME_SHARPNESS_REF, \
+    BEST_FRAME_SIZE_REF, BEST_FRAME_ROI_SIZE, BEST_FRAME_ROI_INSET
+
+
+def face_roi(frame, face, inset=BEST_FRAME_ROI_INSET):
+    """Внутренняя часть рамки лица в оттенках серого; отступ inset отсекает нарисованную рамку."""
+    height, width = frame.shape[:2]
+    x, y, w, h = face
+    dx, dy = int(w * inset), int(h * inset)
+    roi = frame[max(y + dy, 0):min(y + h - dy, height), max(x + dx, 0):min(x + w - dx, width)]
+    if roi.size and roi.ndim == 3:
+        roi = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+    return roi
+
+
+def frame_score(frame, face, weights=BEST_FRAME_WEIGHTS, sharpness_ref=BEST_FRAME_SHARPNESS_REF,
+                size_ref=BEST_FRAME_SIZE_REF, roi_size=BEST_FRAME_ROI_SIZE, inset=BEST_FRAME_ROI_INSET):
+    """Оценка кадра для снимка: резкость лица, его размер и положение относительно центра.
+
+    Резкость — дисперсия лапласиана внутренней части рамки, приведенной к
+    roi_size, чтобы лица разного размера сравнивались одинаково. Возвращает
+    (оценка, резкость).
+    """
+    height, width = frame.shape[:2]
+    x, y, w, h = face
+    roi = face_roi(frame, face, inset)
+    if roi.size == 0:
+        return 0.0, 0.0
+    roi = cv2.resize(roi, roi_size, interpolation=cv2.INTER_AREA)
+    sharpness = float(cv2.Laplacian(roi, cv2.CV_32F).var())
+
+    sharpness_term = sharpness / (sharpness + sharpness_ref)
+    size_term = min(1.0, w * h / (width * height) / size_ref)
+    offset_x = (x + w / 2 - width / 2) / (width / 2)
+    offset_y = (y + h / 2 - height / 2) / (height / 2)
+    center_term = max(0.0, 1.0 - (offset_x ** 2 + offset_y ** 2) ** 0.5)
+    sharpness_weight, size_weight, center_weight = weights
+    score = sharpness_weight * sharpness_term + size_weight * size_term + center_weight * center_term
+    return score, sharpness
+
+
+class BestFrameBuffer:
+    """Лучший кадр за время отсчета PHOTO_DELAY.
+
+    Окно window разбито на slots интервалов, каждый слот кольца хранит
+    только лучший кадр своего интервала (ссылку на кадр, без копирования).
+    Лучший кадр окна обновляется при каждом добавлении; полный просмотр
+    слотов нужен, только когда лучший слот перезаписан или устарел.
+    """
+
+    def __init__(self, slots=BEST_FRAME_SLOTS, window=BEST_FRAME_WINDOW):
+        self.slots = slots
+        self.window = window
+        self.period = window / slots
+        self._slots = [None] * slots  # (интервал, оценка, кадр, рамка)
+        self._best = None
+        self.frames_scored = 0
+        self.score_time = 0.0
+
+    def reset(self):
+        self._slots = [None] * self.slots
+        self._best = None
+
+    def _valid(self, slot, bucket):
+        return slot is not None and slot[0] > bucket - self.slots
+
+    def _scan(self, bucket):
+        best = None
+        for index, slot in enumerate(self._slots):
+            if self._valid(slot, bucket) and (best is None or slot[1] > self._slots[best][1]):
+                best = index
+        return best
+
+    def push(self, frame, face, now=None, prepare=None):
+        """Оценка кадра и сохранение, если он лучший в своем интервале; возвращает оценку.
+
+        prepare(кадр) -> кадр для хранения (например, копия с рамкой) вызывается,
+        только если кадр сохраняется.
+        """
+        start = time.perf_counter()
+        score, _ = frame_score(frame, face)
+        elapsed = time.perf_counter() - start
+        metrics.FRAME_SCORE.observe(elapsed)
+        self.frames_scored += 1
+        self.score_time += elapsed
+
+        bucket = int((time.monotonic() if now is None else now) / self.period)
+        index = bucket % self.slots
+        slot = self._slots[index]
+        if slot is not None and slot[0] == bucket and slot[1] >= score:
+            return score
+        if prepare is not None:
+            frame = prepare(frame)
+        self._slots[index] = (bucket, score, frame, face)
+        if self._best is None or self._best == index:
+            self._best = self._scan(bucket)
+        elif score > self._slots[self._best][1]:
+            self._best = index
+        return score
+
+    def best(self, now=None):
+        """Лучший кадр окна: (кадр, рамка, оценка) или (None, None, None)."""
+        bucket = int((time.monotonic() if now is None else now) / self.period)
+        if self._best is None or not self._valid(self._slots[self._best], bucket):
+            self._best = self._scan(bucket)
+        if self._best is None:
+            return None, None, None
+        _, score, frame, face = self._slots[self._best]
+        return frame, face, score
+
+    def stats(self):
+        """Число оцененных кадров и средняя стоимость оценки."""
+        return {
+            "scored": self.frames_scored,
+            "score_ms": self.score_time / self.frames_scored * 1000 if self.frames_scored else 0.0,
+        }
@@ -3,21 +3,38 @@ import os
 import time
 import logging
 import asyncio
+import threading
+import functools
+import metrics
+from concurrent.futures import Future
+from analysis import AnalysisStage
+from best_frame import BestFrameBuffer
+from detector import create_detector, get_detector
+from motion import MotionGate
+from tracker import FaceTracker
 from config import CAMERA_SOURCE, CAMERA_AUTH, PHOTO_RESOLUTION, PHOTO_DELAY, MIN_AREA_PERCENT, FRAME_SKIP, \
     FACE_FRAME_COLOR, FACE_FRAME_THICKNESS
+from settings import CAPTURE_MAX_FRAME_AGE, CAMERA_MAX_READ_FAILURES, CAMERA_STALL_TIMEOUT, \
+    CAMERA_RECONNECT_BACKOFF, CAMERA_RECONNECT_BACKOFF_MAX, MOTION_GATE_ENABLED, MOTION_IDLE_FRAME_SKIP, \
+    TRACKING_ENABLED, PHOTO_UPLOAD_FORMAT, PHOTO_UPLOAD_QUALITY, PHOTO_UPLOAD_MAX_SIDE, PHOTO_UPLOAD_DIR, \
+    CAMERA_DETECT_RESOLUTION, PHOTO_SETTLE_FRAMES, PHOTO_STREAM_TIMEOUT, PHOTO_STREAM_HOLD, BEST_FRAME_ENABLED
 
-# Настройка логирования
-logging.basicConfig(filename='app.log', level=logging.DEBUG,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
-# Счетчик кадров
-frame_counter = 0
-
-def init_camera(source=CAMERA_SOURCE, auth=CAMERA_AUTH):
-    """Инициализация камеры (локальной или RTSP)."""
+def init_camera(source=CAMERA_SOURCE, auth=CAMERA_AUTH, resolution=None):
+    """Инициализация камеры (локальной или RTSP); resolution задает разрешение локальной камеры."""
     try:
-        if isinstance(source, int):
+        if hasattr(source, "read"):
+            # Готовый источник с интерфейсом cv2.VideoCapture (воспроизведение записи, синтетические кадры)
+            cap = source
+            logging.info(f"Инициализация источника кадров: {source}")
+        elif isinstance(source, int):
             cap = cv2.VideoCapture(source)
             logging.info(f"Попытка инициализации локальной камеры с индексом {source}")
+            if resolution is not None:
+                cap.set(cv2.CAP_PROP_FRAME_WIDTH, resolution[0])
+                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, resolution[1])
+        elif os.path.isfile(source):
+            cap = cv2.VideoCapture(source)
+            logging.info(f"Попытка открытия видеофайла: {source}")
         else:
             if auth:
                 auth_str = f"{auth.replace(':', ':')}@"
@@ -49,52 +66,550 @@ def init_camera(source=CAMERA_SOURCE, auth=CAMERA_AUTH):
         logging.error(f"Ошибка инициализации камеры: {str(e)}")
         raise
 
-async def create_face(cap, cascade_path="haarcascade_frontalface_alt.xml"):
-    """Асинхронная детекция лица в кадре и проверка площади."""
-    global frame_counter
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + cascade_path)
+class CaptureWorker:
+    """Фоновый захват кадров: поток постоянно вычитывает камеру и хранит только последний кадр."""
 
-    frame_counter += 1
-    if frame_counter % FRAME_SKIP != 0:
-        return None, False, None
+    def __init__(self, cap, max_frame_age=CAPTURE_MAX_FRAME_AGE):
+        self.cap = cap
+        self.max_frame_age = max_frame_age
+        self._lock = threading.Lock()
+        self._frame = None
+        self._timestamp = None
+        self._frame_id = 0
+        self._consumed_id = 0
+        self._started_at = time.monotonic()
+        self._running = False
+        self._thread = None
+        # Действия с устройством, которые выполняются в потоке захвата между чтениями
+        self._calls = []
+        # Счетчики для подбора параметров
+        self.frames_captured = 0
+        self.frames_dropped = 0  # перезаписаны новым кадром, так и не попав на детекцию
+        self.frames_stale = 0  # отброшены при чтении как слишком старые
+        self.read_failures = 0
+        self.consecutive_failures = 0
 
-    ret, original_frame = cap.read()
-    if not ret:
-        logging.warning("Не удалось захватить кадр")
-        return None, False, None
+    def start(self):
+        """Запуск потока захвата."""
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="camera-capture", daemon=True)
+        self._thread.start()
+        logging.info("Поток захвата кадров запущен")
+        return self
+
+    def call(self, fn):
+        """Выполнение fn(cap) в потоке захвата между чтениями; возвращает Future с результатом."""
+        future = Future()
+        with self._lock:
+            self._calls.append((fn, future))
+        return future
+
+    def _run_calls(self):
+        with self._lock:
+            calls, self._calls = self._calls, []
+        for fn, future in calls:
+            try:
+                future.set_result(fn(self.cap))
+            except Exception as e:
+                future.set_exception(e)
+
+    def _run(self):
+        try:
+            self._capture_loop()
+        finally:
+            # Камеру освобождает сам поток захвата: release из другого потока во время
+            # зависшего read небезопасен для бэкендов FFmpeg и V4L2
+            self.cap.release()
+
+    def _capture_loop(self):
+        while self._running:
+            if self._calls:
+                self._run_calls()
+            read_start = time.perf_counter()
+            ret, frame = self.cap.read()
+            metrics.FRAME_READ.observe(time.perf_counter() - read_start)
+            timestamp = time.monotonic()
+            if not ret:
+                with self._lock:
+                    self.read_failures += 1
+                    self.consecutive_failures += 1
+                time.sleep(0.01)
+                continue
+            with self._lock:
+                self.consecutive_failures = 0
+                if self._frame_id > self._consumed_id:
+                    self.frames_dropped += 1
+                    metrics.FRAMES_DROPPED.inc()
+                self._frame = frame
+                self._timestamp = timestamp
+                self._frame_id += 1
+                self.frames_captured += 1
+
+    def read_latest(self):
+        """Неблокирующее получение последнего кадра и его времени захвата.
+
+        Каждый кадр отдается не более одного раза; если нового кадра нет
+        или он старше max_frame_age, возвращается (None, None).
+        """
+        with self._lock:
+            if self._frame is None or self._frame_id == self._consumed_id:
+                return None, None
+            self._consumed_id = self._frame_id
+            if time.monotonic() - self._timestamp > self.max_frame_age:
+                self.frames_stale += 1
+                return None, None
+            return self._frame, self._timestamp
+
+    def read(self):
+        """Совместимый с cv2.VideoCapture интерфейс чтения."""
+        frame, _ = self.read_latest()
+        return frame is not None, frame
+
+    def peek(self):
+        """Последний кадр и время его захвата без отметки о прочтении."""
+        with self._lock:
+            return self._frame, self._timestamp
+
+    def last_frame_age(self):
+        """Время (сек) с момента захвата последнего кадра."""
+        with self._lock:
+            last = self._timestamp if self._timestamp is not None else self._started_at
+        return time.monotonic() - last
+
+    def stats(self):
+        """Счетчики захваченных, пропущенных и устаревших кадров."""
+        with self._lock:
+            return {
+                "captured": self.frames_captured,
+                "dropped": self.frames_dropped,
+                "stale": self.frames_stale,
+                "read_failures": self.read_failures,
+            }
+
+    def release(self):
+        """Остановка потока; камеру освобождает поток захвата при выходе."""
+        self._running = False
+        if self._thread is None:
+            self.cap.release()
+        else:
+            self._thread.join(timeout=2)
+            if self._thread.is_alive():
+                # Чтение зависло (обычно это и есть причина переподключения): поток
+                # освободит камеру, когда read вернется
+                logging.warning("Поток захвата не завершился за 2 с, камера будет освобождена им самим")
+            self._thread = None
+        with self._lock:
+            calls, self._calls = self._calls, []
+        for _, future in calls:
+            future.cancel()
+        logging.info(f"Поток захвата остановлен, статистика: {self.stats()}")
+
+class CameraSession:
+    """Долгоживущая сессия камеры: открывается один раз и сама переподключается при сбоях."""
+
+    def __init__(self, source=CAMERA_SOURCE, auth=CAMERA_AUTH,
+                 max_read_failures=CAMERA_MAX_READ_FAILURES, stall_timeout=CAMERA_STALL_TIMEOUT,
+                 backoff=CAMERA_RECONNECT_BACKOFF, backoff_max=CAMERA_RECONNECT_BACKOFF_MAX, resolution=None):
+        self.source = source
+        self.auth = auth
+        self.resolution = resolution
+        # Источник снимка высокого разрешения (MainStreamStill или ResolutionStill); None — снимок из потока детекции
+        self.still = None
+        self.max_read_failures = max_read_failures
+        self.stall_timeout = stall_timeout
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._worker = None
+        self._thread = None
+        self.reconnects = 0
+        # Счетчики уже остановленных потоков захвата
+        self._totals = {"captured": 0, "dropped": 0, "stale": 0, "read_failures": 0}
+
+    def start(self):
+        """Запуск супервизора; первое подключение выполняется в фоне."""
+        self._thread = threading.Thread(target=self._supervise, name="camera-supervisor", daemon=True)
+        self._thread.start()
+        return self
+
+    @property
+    def connected(self):
+        return self._worker is not None
+
+    def _connect(self):
+        with metrics.CAMERA_INIT.time():
+            cap = init_camera(self.source, self.auth, self.resolution)
+        worker = CaptureWorker(cap).start()
+        with self._lock:
+            self._worker = worker
+
+    def _disconnect(self):
+        with self._lock:
+            worker, self._worker = self._worker, None
+        if worker is not None:
+            worker.release()
+            for key, value in worker.stats().items():
+                self._totals[key] += value
+
+    def _is_healthy(self, worker):
+        if worker.consecutive_failures >= self.max_read_failures:
+            logging.warning(f"Камера: {worker.consecutive_failures} неудачных чтений подряд")
+            return False
+        age = worker.last_frame_age()
+        if age > self.stall_timeout:
+            logging.warning(f"Камера: нет новых кадров {age:.1f} с")
+            return False
+        return True
+
+    def _supervise(self):
+        delay = self.backoff
+        while not self._stop.is_set():
+            if self._worker is None:
+                try:
+                    self._connect()
+                    delay = self.backoff
+                except Exception as e:
+                    logging.error(f"Переподключение камеры не удалось, повтор через {delay:.1f} с: {str(e)}")
+                    self._stop.wait(delay)
+                    delay = min(delay * 2, self.backoff_max)
+                    continue
+            elif not self._is_healthy(self._worker):
+                self._disconnect()
+                self.reconnects += 1
+                metrics.CAMERA_RECONNECTS.inc()
+                logging.info(f"Переподключение камеры, попытка {self.reconnects}")
+                continue
+            self._stop.wait(0.5)
+
+    @property
+    def worker(self):
+        with self._lock:
+            return self._worker
 
-    # Уменьшаем кадр до 640x480 для анализа
-    analysis_frame = cv2.resize(original_frame, (640, 480))
-    gray = cv2.cvtColor(analysis_frame, cv2.COLOR_BGR2GRAY)
-    faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+    def read(self):
+        """Неблокирующее чтение последнего кадра; (False, None), пока камера недоступна."""
+        with self._lock:
+            worker = self._worker
+        if worker is None:
+            return False, None
+        return worker.read()
 
-    if len(faces) == 0:
-        return original_frame, False, None
+    def stats(self):
+        """Суммарные счетчики кадров за всю сессию и число переподключений."""
+        totals = dict(self._totals)
+        worker = self._worker
+        if worker is not None:
+            for key, value in worker.stats().items():
+                totals[key] += value
+        totals["reconnects"] = self.reconnects
+        return totals
 
-    # Масштабируем координаты лица обратно к исходному разрешению
-    scale_x = original_frame.shape[1] / 640
-    scale_y = original_frame.shape[0] / 480
+    def release(self):
+        """Остановка супервизора и освобождение камеры."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        self._disconnect()
+        if self.still is not None:
+            self.still.release()
+        logging.info(f"Сессия камеры закрыта, статистика: {self.stats()}")
 
-    frame_area = 640 * 480  # Площадь для анализа
-    max_area = 0
-    max_face = None
-    for (x, y, w, h) in faces:
-        area = w * h
-        if area > max_area:
-            max_area = area
-            max_face = (int(x * scale_x), int(y * scale_y), int(w * scale_x), int(h * scale_y))
+def map_box(box, from_shape, to_shape):
+    """Пересчет рамки (x, y, w, h) между кадрами разного разрешения с одним полем зрения."""
+    scale_x = to_shape[1] / from_shape[1]
+    scale_y = to_shape[0] / from_shape[0]
+    x, y, w, h = box
+    return int(x * scale_x), int(y * scale_y), int(w * scale_x), int(h * scale_y)
 
-    if max_area / frame_area < MIN_AREA_PERCENT:
-        logging.info(f"Лицо занимает менее {MIN_AREA_PERCENT * 100}% кадра")
-        return original_frame, False, None
+def draw_face(frame, box):
+    """Рамка вокруг лица на кадре."""
+    x, y, w, h = box
+    cv2.rectangle(frame, (x, y), (x + w, y + h), FACE_FRAME_COLOR, FACE_FRAME_THICKNESS)
 
-    if max_face is not None:
-        x, y, w, h = max_face
-        cv2.rectangle(original_frame, (x, y), (x + w, y + h), FACE_FRAME_COLOR, FACE_FRAME_THICKNESS)
-        logging.info(f"Рамка добавлена: цвет {FACE_FRAME_COLOR}, толщина {FACE_FRAME_THICKNESS}")
+def framed_copy(frame, box):
+    """Копия кадра с рамкой лица; исходный кадр (общий с потоком захвата) не меняется."""
+    frame = frame.copy()
+    draw_face(frame, box)
+    return frame
 
-    logging.info(f"Обнаружено лицо, площадь: {max_area / frame_area * 100:.2f}%")
-    return original_frame, True, max_face
+class MainStreamStill:
+    """Снимок с основного потока IP-камеры, пока детекция идет по дешевому подпотоку.
+
+    Основной поток открывается в фоне с началом отсчета PHOTO_DELAY и
+    закрывается после снимка, так что полное разрешение декодируется только
+    несколько секунд за цикл. Декодирование после открытия начинается с
+    ключевого кадра, и к моменту снимка поток уже прогрет.
+    """
+
+    def __init__(self, source, auth=CAMERA_AUTH, timeout=PHOTO_STREAM_TIMEOUT):
+        self.source = source
+        self.auth = auth
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._worker = None
+        self._wanted = False
+        self._opening = False
+
+    def prepare(self):
+        """Открытие основного потока в фоне, если он еще не открыт."""
+        with self._lock:
+            self._wanted = True
+            if self._worker is not None or self._opening:
+                return
+            self._opening = True
+        threading.Thread(target=self._open, name="photo-stream", daemon=True).start()
+
+    def _open(self):
+        worker = None
+        try:
+            worker = CaptureWorker(init_camera(self.source, self.auth)).start()
+        except Exception as e:
+            logging.error(f"Не удалось открыть основной поток камеры: {str(e)}")
+        with self._lock:
+            self._opening = False
+            if self._wanted:
+                self._worker, worker = worker, None
+        if worker is not None:
+            # Поток закрыли, пока он открывался
+            worker.release()
+
+    def latest(self):
+        """Последний кадр основного потока и время его захвата, (None, None), если поток еще не готов.
+
+        Кадр общий с потоком захвата и не копируется: перед изменением или
+        хранением его нужно скопировать.
+        """
+        with self._lock:
+            worker = self._worker
+        if worker is None:
+            return None, None
+        return worker.peek()
+
+    def take(self, since):
+        """Первый кадр основного потока, захваченный не раньше since (time.monotonic)."""
+        self.prepare()
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                worker = self._worker
+            if worker is not None:
+                frame, timestamp = worker.peek()
+                if frame is not None and timestamp >= since:
+                    return frame.copy()
+            time.sleep(0.01)
+        return None
+
+    def release(self):
+        with self._lock:
+            self._wanted = False
+            worker, self._worker = self._worker, None
+        if worker is not None:
+            worker.release()
+
+class ResolutionStill:
+    """Снимок локальной камеры в PHOTO_RESOLUTION при детекции в CAMERA_DETECT_RESOLUTION.
+
+    Разрешение переключается в потоке захвата между чтениями; после
+    переключения пропускается несколько кадров на подстройку экспозиции.
+    """
+
+    def __init__(self, session, resolution=PHOTO_RESOLUTION, detect_resolution=CAMERA_DETECT_RESOLUTION,
+                 settle_frames=PHOTO_SETTLE_FRAMES, timeout=PHOTO_STREAM_TIMEOUT):
+        self.session = session
+        self.resolution = resolution
+        self.detect_resolution = detect_resolution
+        self.settle_frames = settle_frames
+        self.timeout = timeout
+
+    def prepare(self):
+        pass
+
+    def latest(self):
+        # Кадр высокого разрешения есть только в момент снимка
+        return None, None
+
+    def _grab(self, cap):
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.resolution[0])
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.resolution[1])
+        try:
+            frame = None
+            for _ in range(self.settle_frames + 1):
+                ret, frame = cap.read()
+            return frame if ret else None
+        finally:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.detect_resolution[0])
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.detect_resolution[1])
+
+    def take(self, since):
+        worker = self.session.worker
+        if worker is None:
+            return None
+        try:
+            return worker.call(self._grab).result(self.timeout)
+        except Exception as e:
+            logging.error(f"Не удалось сделать снимок в высоком разрешении: {str(e)}")
+            return None
+
+    def release(self):
+        pass
+
+class FacePipeline:
+    """Состояние анализа одного источника: пропуск кадров, детектор движения, трек, буферы и детектор."""
+
+    def __init__(self, name="camera", detector=None, clock=time.monotonic):
+        self.name = name
+        self.detector = detector if detector is not None else get_detector()
+        self.frame_counter = 0
+        # Подготовка кадра анализа в переиспользуемых буферах
+        self.analysis_stage = AnalysisStage()
+        # Детектор движения перед полной детекцией лиц
+        # clock — время для детектора движения и пропуска кадров в простое; по умолчанию часы системы
+        self.motion_gate = MotionGate(clock=clock) if MOTION_GATE_ENABLED else None
+        # Сопровождение найденного лица между детекциями
+        self.face_tracker = FaceTracker() if TRACKING_ENABLED else None
+        # Счетчики для отчета о FPS и задержке детекции
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_frames = 0
+        self._window_time = 0.0
+        # Накопительные счетчики: читаются без сброса (статистика процесса захвата)
+        self.frames_analyzed = 0
+        self.analysis_time = 0.0
+
+    def next_frame(self, cap):
+        """Дешевая часть: решение о пропуске и чтение последнего кадра из буфера захвата."""
+        # Пока в кадре кто-то есть, анализируем часто, в простое — редко
+        active = self.motion_gate is None or self.motion_gate.active
+        frame_skip = FRAME_SKIP if active else MOTION_IDLE_FRAME_SKIP
+        self.frame_counter += 1
+        if self.frame_counter % frame_skip != 0:
+            return None
+
+        ret, frame = cap.read()
+        if not ret:
+            # Нового кадра в буфере захвата пока нет
+            return None
+        return frame
+
+    def analyze(self, original_frame):
+        """Детекция лица в кадре и проверка площади; может выполняться в рабочем потоке."""
+        start = time.perf_counter()
+        try:
+            result = self._analyze(original_frame)
+            if result[1]:
+                metrics.DETECTIONS.inc()
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.DETECTION.observe(elapsed)
+            metrics.FRAMES_ANALYZED.inc()
+            with self._lock:
+                self._window_frames += 1
+                self._window_time += elapsed
+                self.frames_analyzed += 1
+                self.analysis_time += elapsed
+
+    def _analyze(self, original_frame):
+        motion_gate = self.motion_gate
+        face_tracker = self.face_tracker
+        if motion_gate is not None and not motion_gate.should_detect(original_frame):
+            return original_frame, False, None
+
+        # Уменьшаем кадр до разрешения анализа и переводим в серое
+        gray = self.analysis_stage.process(original_frame)
+
+        faces = None
+        if face_tracker is not None and face_tracker.tracking:
+            box = face_tracker.update(gray, self.detector)
+            if box is not None:
+                faces = [box]
+        if faces is None:
+            # Полнокадровая детекция — только без активного трека
+            faces = self.detector.detect(gray)
+            if face_tracker is not None and len(faces) > 0:
+                face_tracker.start(gray, max(faces, key=lambda f: f[2] * f[3]))
+
+        if len(faces) == 0:
+            return original_frame, False, None
+        if motion_gate is not None:
+            motion_gate.mark_face()
+
+        # Масштабируем координаты лица обратно к исходному разрешению
+        analysis_width, analysis_height = self.analysis_stage.size
+        scale_x = original_frame.shape[1] / analysis_width
+        scale_y = original_frame.shape[0] / analysis_height
+
+        frame_area = self.analysis_stage.area  # Площадь для анализа
+        max_area = 0
+        max_face = None
+        for (x, y, w, h) in faces:
+            area = w * h
+            if area > max_area:
+                max_area = area
+                max_face = (int(x * scale_x), int(y * scale_y), int(w * scale_x), int(h * scale_y))
+
+        if max_area / frame_area < MIN_AREA_PERCENT:
+            # Сообщения каждого кадра: ленивое форматирование, частоту ограничивает logging_setup
+            logging.debug("Лицо занимает менее %s%% кадра", MIN_AREA_PERCENT * 100)
+            return original_frame, False, None
+
+        if max_face is not None:
+            draw_face(original_frame, max_face)
+            logging.debug("Рамка добавлена: цвет %s, толщина %s", FACE_FRAME_COLOR, FACE_FRAME_THICKNESS)
+
+        logging.info("Обнаружено лицо, площадь: %.2f%%", max_area / frame_area * 100)
+        return original_frame, True, max_face
+
+    def reset(self):
+        """Сброс трека и окна FPS перед новым циклом захвата.
+
+        Окно начинается здесь, чтобы FPS анализа не учитывал время простоя
+        между циклами (экран результата).
+        """
+        if self.face_tracker is not None:
+            self.face_tracker.reset()
+        with self._lock:
+            self._window_start, self._window_frames, self._window_time = time.monotonic(), 0, 0.0
+
+    def stats(self):
+        """FPS анализа и средняя задержка детекции с начала цикла захвата (reset) или предыдущего вызова."""
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._window_start
+            frames, total = self._window_frames, self._window_time
+            self._window_start, self._window_frames, self._window_time = now, 0, 0.0
+        return {
+            "fps": frames / elapsed if elapsed > 0 else 0.0,
+            "detect_ms": total / frames * 1000 if frames else 0.0,
+        }
+
+    def totals(self):
+        """Проанализировано кадров и суммарное время анализа с создания конвейера."""
+        with self._lock:
+            return self.frames_analyzed, self.analysis_time
+
+_default_pipeline = None
+
+def default_pipeline():
+    """Общий конвейер анализа для однокамерного режима."""
+    global _default_pipeline
+    if _default_pipeline is None:
+        _default_pipeline = FacePipeline()
+    return _default_pipeline
+
+async def create_face(cap, pipeline=None):
+    """Асинхронная детекция лица в кадре и проверка площади."""
+    if pipeline is None:
+        pipeline = default_pipeline()
+
+    original_frame = pipeline.next_frame(cap)
+    if original_frame is None:
+        return None, False, None
+
+    # OpenCV отпускает GIL, поэтому детекция в потоке не блокирует цикл событий и другие камеры
+    return await asyncio.to_thread(pipeline.analyze, original_frame)
 
 def save_photo(frame, path):
     """Сохранение фото в формате PNG с проверкой качества."""
@@ -106,9 +621,79 @@ def save_photo(frame, path):
     logging.info(f"Изображение сохранено: {path}, размер: {os.path.getsize(path)} байт")
     return path
 
+# Расширение файла и параметры кодирования для форматов отправки
+UPLOAD_FORMATS = {
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+    "png": (".png", None),
+}
+
+def encode_photo(frame, fmt=PHOTO_UPLOAD_FORMAT, quality=PHOTO_UPLOAD_QUALITY, max_side=PHOTO_UPLOAD_MAX_SIDE):
+    """Однократное кодирование снимка в памяти для отправки в API."""
+    if fmt not in UPLOAD_FORMATS:
+        raise Exception(f"Неизвестный формат снимка: {fmt}")
+    extension, quality_flag = UPLOAD_FORMATS[fmt]
+
+    height, width = frame.shape[:2]
+    if max_side and max(width, height) > max_side:
+        scale = max_side / max(width, height)
+        frame = cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+    params = [int(quality_flag), int(quality)] if quality_flag is not None else []
+    success, buffer = cv2.imencode(extension, frame, params)
+    if not success:
+        logging.error(f"Не удалось закодировать снимок в {fmt}")
+        raise Exception(f"Не удалось закодировать снимок в {fmt}")
+    data = buffer.tobytes()
+    logging.info(f"Снимок закодирован: {fmt}, {frame.shape[1]}x{frame.shape[0]}, {len(data)} байт")
+    return data
+
+def write_upload(data, fmt=PHOTO_UPLOAD_FORMAT, directory=PHOTO_UPLOAD_DIR, tag=""):
+    """Запись закодированного снимка для api_client.get_dossier, который принимает путь к файлу."""
+    path = os.path.join(directory, f"kiosk_upload_{os.getpid()}{tag}{UPLOAD_FORMATS[fmt][0]}")
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+def open_cameras(sources, photo_sources=None):
+    """Запуск сессий и конвейеров анализа для всех источников.
+
+    photo_sources — основные потоки для снимка, по одному на источник (None —
+    снимок из потока детекции). Локальная камера при заданном
+    CAMERA_DETECT_RESOLUTION снимает в PHOTO_RESOLUTION.
+    """
+    photo_sources = list(photo_sources or [])
+    cameras = []
+    for index, source in enumerate(sources):
+        local = isinstance(source, int)
+        cap = CameraSession(source, CAMERA_AUTH, resolution=CAMERA_DETECT_RESOLUTION if local else None)
+        photo_source = photo_sources[index] if index < len(photo_sources) else None
+        if photo_source is not None:
+            cap.still = MainStreamStill(photo_source)
+        elif local and CAMERA_DETECT_RESOLUTION is not None:
+            cap.still = ResolutionStill(cap)
+        cap.start()
+        # В многокамерном режиме у каждой камеры свой детектор: модели OpenCV
+        # не рассчитаны на одновременные вызовы из нескольких потоков
+        detector = get_detector() if len(sources) == 1 else create_detector()
+        cameras.append((cap, FacePipeline(str(index), detector)))
+    logging.info(f"Запущено камер: {len(cameras)}")
+    return cameras
+
+
+def release_cameras(cameras):
+    """Освобождение всех камер."""
+    for cap, _ in cameras:
+        release_camera(cap)
+
 async def check_exit():
     """Асинхронная проверка нажатия клавиши ESC для выхода."""
-    if cv2.waitKey(1) & 0xFF == 27:
+    try:
+        key = cv2.waitKey(1)
+    except cv2.error:
+        # Сборка OpenCV без GUI (headless): клавиатуры нет
+        return True
+    if key & 0xFF == 27:
         logging.info("Выход по клавише ESC")
         return False
     return True
@@ -116,41 +701,166 @@ async def check_exit():
 def release_camera(cap):
     """Освобождение камеры."""
     cap.release()
-    cv2.destroyAllWindows()
+    try:
+        cv2.destroyAllWindows()
+    except cv2.error:
+        # Сборка OpenCV без GUI (headless): окон нет
+        pass
     logging.info("Камера освобождена")
 
-async def capture_with_delay(cap):
-    """Асинхронный захват фото с задержкой и проверкой площади."""
+async def capture_with_delay(cap, pipeline=None, on_candidate=None):
+    """Асинхронный захват фото с задержкой и проверкой площади.
+
+    Возвращает (снимок, рамка лица на снимке) или None при выходе по ESC.
+    on_candidate(источник, кадр, рамка, доля отсчета) вызывается на каждом кадре
+    с лицом во время отсчета и с кадром None, когда лицо потеряно. При
+    BEST_FRAME_ENABLED кандидат и снимок — лучший кадр отсчета на этот момент.
+    """
+    if pipeline is None:
+        pipeline = default_pipeline()
+    pipeline.reset()
+    # Снимок высокого разрешения: основной поток или переключение разрешения локальной камеры
+    still = getattr(cap, "still", None)
+    best = BestFrameBuffer() if BEST_FRAME_ENABLED else None
     start_time = None
+    lost_at = None
     face_detected = False
+    still_stamp = None  # время захвата последнего рассмотренного кадра основного потока
+
+    try:
+        while True:
+            frame, detected, face = await create_face(cap, pipeline)
+            if frame is None and not detected:
+                if not await check_exit():
+                    return None
+                await asyncio.sleep(0.01)
+                continue
+
+            if not detected:
+                if face_detected:
+                    lost_at = time.time()
+                    if on_candidate is not None:
+                        on_candidate(pipeline.name, None, None, 0.0)
+                start_time = None
+                face_detected = False
+                if still is not None and lost_at is not None and time.time() - lost_at >= PHOTO_STREAM_HOLD:
+                    # Лицо не вернулось: основной поток больше не декодируем
+                    still.release()
+                    lost_at = None
+            else:
+                lost_at = None
+                if not face_detected:
+                    start_time = time.time()
+                    face_detected = True
+                    logging.info("Начало отсчета задержки для снимка")
+                    if still is not None:
+                        still.prepare()
+                    if best is not None:
+                        best.reset()
+                elif time.time() - start_time >= PHOTO_DELAY:
+                    logging.info("Снимок сделан")
+                    # От начала отсчета, а не от входа в захват: простой без посетителей не учитывается
+                    metrics.STABLE_FACE_WAIT.observe(time.time() - start_time)
+                    photo, box = frame, face
+                    if still is not None:
+                        photo, box = await take_still(still, frame, face)
+                    return select_photo(best, photo, box, frame, face)
+                if best is None and on_candidate is None:
+                    # Кандидаты никому не нужны
+                    candidate = None
+                elif still is None:
+                    candidate, box, prepare = frame, face, None
+                else:
+                    # Кадр детекции слишком мал для отправки: кандидат только из основного потока.
+                    # Уже рассмотренный кадр пропускается, копия с рамкой — только для хранимого
+                    candidate, stamp = still.latest()
+                    if stamp is not None and stamp == still_stamp:
+                        candidate = None
+                    if candidate is not None:
+                        still_stamp = stamp
+                        box = map_box(face, frame.shape, candidate.shape)
+                        prepare = functools.partial(framed_copy, box=box)
+                if candidate is not None:
+                    if best is not None:
+                        best.push(candidate, box, prepare=prepare)
+                        candidate, box, _ = best.best()
+                    elif prepare is not None:
+                        candidate = prepare(candidate)
+                    if on_candidate is not None:
+                        on_candidate(pipeline.name, candidate, box, (time.time() - start_time) / PHOTO_DELAY)
+
+            if frame is not None:
+                # cv2.imshow('Camera Feed', frame)
+                pass
 
-    while True:
-        frame, detected, face = await create_face(cap)
-        if frame is None and not detected:
             if not await check_exit():
                 return None
+
             await asyncio.sleep(0.01)
-            continue
+    finally:
+        if still is not None:
+            still.release()
 
-        if not detected:
-            start_time = None
-            face_detected = False
-        else:
-            if not face_detected:
-                start_time = time.time()
-                face_detected = True
-                logging.info("Начало отсчета задержки для снимка")
-            elif time.time() - start_time >= PHOTO_DELAY:
-                logging.info("Снимок сделан")
-                return frame
-
-        if frame is not None:
-            # cv2.imshow('Camera Feed', frame)
-            pass
-
-        if not await check_exit():
-            return None
+    return None
 
-        await asyncio.sleep(0.01)
+async def take_still(still, frame, face):
+    """Снимок высокого разрешения с рамкой лица, пересчитанной из кадра детекции.
 
-    return None
+    Возвращает (снимок, рамка) или (None, None), если снимок получить не удалось.
+    """
+    photo = await asyncio.to_thread(still.take, time.monotonic())
+    if photo is None:
+        logging.warning("Снимок высокого разрешения не получен")
+        return None, None
+    box = map_box(face, frame.shape, photo.shape)
+    draw_face(photo, box)
+    logging.info(f"Снимок высокого разрешения: {photo.shape[1]}x{photo.shape[0]}")
+    return photo, box
+
+def select_photo(best, photo, box, frame, face):
+    """Итоговый снимок и рамка: лучший кадр отсчета с учетом кадра в момент срабатывания.
+
+    Если кадров нет (снимок высокого разрешения не получен и буфер пуст),
+    возвращается кадр детекции.
+    """
+    if best is not None:
+        if photo is not None:
+            best.push(photo, box)
+        chosen, chosen_box, score = best.best()
+        if chosen is not None:
+            if chosen is not photo:
+                logging.info(f"Выбран более ранний кадр отсчета, оценка {score:.2f}")
+            logging.info(f"Выбор кадра: {best.stats()}")
+            photo, box = chosen, chosen_box
+    if photo is None:
+        logging.warning("Используется кадр детекции")
+        photo, box = frame, face
+    return photo, box
+
+async def capture_first(cameras, on_candidate=None):
+    """Параллельный захват со всех камер; возвращает первый стабильный кадр, рамку лица и камеру.
+
+    cameras — список пар (сессия камеры, конвейер анализа); камера обозначается
+    именем конвейера, как источник в on_candidate. None — выход по ESC.
+    """
+    tasks = [asyncio.create_task(capture_with_delay(cap, pipeline, on_candidate)) for cap, pipeline in cameras]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+    photo = None
+    for (_, pipeline), task in zip(cameras, tasks):
+        if task in done:
+            photo = task.result()
+            if photo is not None:
+                logging.info(f"Снимок сделан камерой {pipeline.name}")
+                photo = photo + (pipeline.name,)
+            break
+    for _, pipeline in cameras:
+        stats = pipeline.stats()
+        logging.info(f"Камера {pipeline.name}: {stats['fps']:.1f} FPS анализа, "
+                     f"детекция {stats['detect_ms']:.1f} мс")
+    return photo
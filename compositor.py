@@ -0,0 +1,152 @@
+import time
+import pygame
+import metrics
+
+BLACK = (0, 0, 0)
+# Высота пустой строки текста, как в исходной раскладке
+EMPTY_LINE_HEIGHT = 40
+
+
+class ResultCompositor:
+    """Композитор экрана результата.
+
+    Статичные слои (фото и шапка) собираются в фоновую поверхность один раз.
+    Готовые строки досье дорисовываются в высокую поверхность текста, которая
+    выводится через окно прокрутки. На экран отправляются только изменившиеся
+    прямоугольники через pygame.display.update(rects).
+    """
+
+    def __init__(self, screen, photo, photo_pos, header_surfaces, header_pos, scroll_rect):
+        self.screen = screen
+        self.scroll_rect = scroll_rect
+        self.scroll_offset = 0
+        self._dirty = []
+
+        self.background = pygame.Surface(screen.get_size()).convert()
+        self.background.fill(BLACK)
+        self.background.blit(photo, photo_pos)
+        self.header_pos = header_pos
+        self._header_rect = self._draw_header(header_surfaces)
+
+        # Поверхность текста растет по мере появления строк; отсчет строк с y=1, как раньше
+        self._text = self._new_text_surface(max(scroll_rect.height, EMPTY_LINE_HEIGHT) * 2)
+        self.text_height = 1
+
+        self.frames = 0
+        self.frame_time = 0.0
+        self._frame_start = None
+
+    def _draw_header(self, header_surfaces):
+        x, y = self.header_pos
+        rect = pygame.Rect(x, y, 0, 0)
+        for surface in header_surfaces:
+            if surface:
+                rect.union_ip(self.background.blit(surface, (x, y)))
+                y += surface.get_height()
+            else:
+                y += EMPTY_LINE_HEIGHT
+        return rect
+
+    def set_header(self, header_surfaces):
+        """Замена шапки (номер запроса может прийти позже текста); перерисовывается только ее область."""
+        self.background.fill(BLACK, self._header_rect)
+        old_rect = self._header_rect
+        self._header_rect = self._draw_header(header_surfaces)
+        self.clear(old_rect.union(self._header_rect))
+
+    def _new_text_surface(self, height):
+        surface = pygame.Surface((self.scroll_rect.width, height)).convert()
+        surface.fill(BLACK)
+        return surface
+
+    def _ensure_capacity(self, height):
+        if height <= self._text.get_height():
+            return
+        grown = self._new_text_surface(max(height, self._text.get_height() * 2))
+        grown.blit(self._text, (0, 0))
+        self._text = grown
+
+    def begin_frame(self):
+        self._frame_start = time.perf_counter()
+
+    def present_all(self):
+        """Полная перерисовка экрана — только при первом показе."""
+        self.screen.blit(self.background, (0, 0))
+        self._draw_viewport()
+        self._dirty = []
+        pygame.display.flip()
+
+    def _draw_viewport(self):
+        area = pygame.Rect(0, self.scroll_offset, self.scroll_rect.width, self.scroll_rect.height)
+        self.screen.blit(self._text, self.scroll_rect.topleft, area)
+        self._dirty.append(self.scroll_rect)
+
+    @staticmethod
+    def line_height(surface):
+        return surface.get_height() if surface else EMPTY_LINE_HEIGHT
+
+    def append_line(self, surface):
+        """Окончательная строка дорисовывается в поверхность текста и выводится на экран."""
+        top = self.text_height
+        height = self.line_height(surface)
+        self._ensure_capacity(top + height)
+        if surface:
+            self._text.blit(surface, (0, top))
+        self.text_height += height
+        if surface:
+            self._restore_text_rect(top, surface.get_width(), height)
+
+    def scroll_to(self, offset):
+        if offset != self.scroll_offset:
+            self.scroll_offset = offset
+            self._draw_viewport()
+
+    def _line_rect(self, top, width, height):
+        rect = pygame.Rect(self.scroll_rect.x, self.scroll_rect.y + top - self.scroll_offset, width, height)
+        return rect.clip(self.scroll_rect)
+
+    def _restore_text_rect(self, top, width, height):
+        rect = self._line_rect(top, width, height)
+        if rect.width and rect.height:
+            area = rect.move(-self.scroll_rect.x, self.scroll_offset - self.scroll_rect.y)
+            self.screen.blit(self._text, rect.topleft, area)
+            self._dirty.append(rect)
+        return rect
+
+    def draw_fading_line(self, surface, alpha):
+        """Появляющаяся строка под текущей позицией конца текста с заданной прозрачностью."""
+        rect = self._restore_text_rect(self.text_height, surface.get_width(), surface.get_height())
+        if not (rect.width and rect.height):
+            return
+        self.screen.set_clip(rect)
+        surface.set_alpha(alpha)
+        self.screen.blit(surface, (self.scroll_rect.x, self.scroll_rect.y + self.text_height - self.scroll_offset))
+        # Поверхности строк общие (кэш раскладки), поэтому прозрачность возвращается обратно
+        surface.set_alpha(255)
+        self.screen.set_clip(None)
+
+    def clear(self, rect):
+        """Восстановление фона в прямоугольнике перед перерисовкой динамического элемента."""
+        self.screen.blit(self.background, rect, rect)
+        self._dirty.append(pygame.Rect(rect))
+
+    def blit(self, surface, pos):
+        self._dirty.append(self.screen.blit(surface, pos))
+
+    def mark_dirty(self, rect):
+        self._dirty.append(pygame.Rect(rect))
+
+    def present(self):
+        """Вывод на экран только изменившихся областей."""
+        if self._dirty:
+            pygame.display.update(self._dirty)
+            self._dirty = []
+        if self._frame_start is not None:
+            elapsed = time.perf_counter() - self._frame_start
+            metrics.RENDER_FRAME.observe(elapsed)
+            self.frame_time += elapsed
+            self.frames += 1
+            self._frame_start = None
+
+    def mean_frame_ms(self):
+        return self.frame_time / self.frames * 1000 if self.frames else 0.0
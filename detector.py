@@ -0,0 +1,154 @@
+import cv2
+import logging
+import math
+import threading
+from config import MIN_AREA_PERCENT
+from settings import DETECTOR_BACKEND, HAAR_CASCADE_FILE, LBP_CASCADE_PATH, DNN_MODEL_PATH, DNN_CONFIG_PATH, \
+    DNN_CONFIDENCE, DETECTOR_SIZE_PRUNING, DETECTOR_MIN_SIZE_MARGIN, DETECTOR_SEARCH_MIN_FACE, ANALYSIS_SIZE
+
+
+class FaceDetector:
+    """Базовый детектор лиц: detect(gray) возвращает список рамок (x, y, w, h)."""
+
+    name = "base"
+
+    def detect(self, gray):
+        raise NotImplementedError
+
+
+class CascadeDetector(FaceDetector):
+    """Детектор на каскаде OpenCV (Haar или LBP).
+
+    min_size/max_size ограничивают диапазон масштабов пирамиды. При
+    search_scale > 1 поиск идет на кадре, уменьшенном в search_scale раз,
+    а рамки пересчитываются в координаты исходного кадра.
+    """
+
+    supports_size_limits = True
+
+    def __init__(self, path, scale_factor=1.1, min_neighbors=5, min_size=(30, 30), max_size=None, search_scale=1.0):
+        self.cascade = cv2.CascadeClassifier(path)
+        if self.cascade.empty():
+            logging.error(f"Не удалось загрузить каскад: {path}")
+            raise Exception(f"Не удалось загрузить каскад: {path}")
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+        self.max_size = max_size
+        self.search_scale = search_scale
+        logging.info(f"Каскад загружен: {path}, лица от {min_size} до {max_size}, уменьшение поиска {search_scale:.2f}")
+
+    def detect(self, gray):
+        scale = self.search_scale
+        min_size = self.min_size
+        # (0, 0) — без верхней границы; пустой кортеж OpenCV 4.x не принимает
+        max_size = self.max_size or (0, 0)
+        if scale > 1:
+            gray = cv2.resize(gray, (int(gray.shape[1] / scale), int(gray.shape[0] / scale)),
+                              interpolation=cv2.INTER_AREA)
+            min_size = tuple(int(v / scale) for v in min_size)
+            max_size = tuple(int(math.ceil(v / scale)) for v in max_size)
+        faces = self.cascade.detectMultiScale(gray, scaleFactor=self.scale_factor, minNeighbors=self.min_neighbors,
+                                              minSize=min_size, maxSize=max_size)
+        if scale > 1:
+            return [tuple(int(round(v * scale)) for v in face) for face in faces]
+        return [tuple(int(v) for v in face) for face in faces]
+
+
+class HaarDetector(CascadeDetector):
+    """Каскад Хаара из комплекта OpenCV."""
+
+    name = "haar"
+
+    def __init__(self, cascade_file=HAAR_CASCADE_FILE, **kwargs):
+        super().__init__(cv2.data.haarcascades + cascade_file, **kwargs)
+
+
+class LbpDetector(CascadeDetector):
+    """LBP-каскад из локального файла: быстрее Хаара ценой части точности."""
+
+    name = "lbp"
+
+    def __init__(self, cascade_path=LBP_CASCADE_PATH, **kwargs):
+        super().__init__(cascade_path, **kwargs)
+
+
+class DnnDetector(FaceDetector):
+    """Нейросетевой детектор cv2.dnn (SSD) из локальных файлов модели."""
+
+    name = "dnn"
+
+    def __init__(self, model_path=DNN_MODEL_PATH, config_path=DNN_CONFIG_PATH, confidence=DNN_CONFIDENCE,
+                 input_size=(300, 300), mean=(104.0, 177.0, 123.0)):
+        self.net = cv2.dnn.readNet(model_path, config_path)
+        self.confidence = confidence
+        self.input_size = input_size
+        self.mean = mean
+        logging.info(f"DNN-модель загружена: {model_path}")
+
+    def detect(self, gray):
+        height, width = gray.shape[:2]
+        image = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR) if gray.ndim == 2 else gray
+        blob = cv2.dnn.blobFromImage(image, 1.0, self.input_size, self.mean)
+        self.net.setInput(blob)
+        detections = self.net.forward()
+
+        faces = []
+        for i in range(detections.shape[2]):
+            if detections[0, 0, i, 2] < self.confidence:
+                continue
+            x1 = int(max(0.0, detections[0, 0, i, 3]) * width)
+            y1 = int(max(0.0, detections[0, 0, i, 4]) * height)
+            x2 = int(min(1.0, detections[0, 0, i, 5]) * width)
+            y2 = int(min(1.0, detections[0, 0, i, 6]) * height)
+            if x2 > x1 and y2 > y1:
+                faces.append((x1, y1, x2 - x1, y2 - y1))
+        return faces
+
+
+BACKENDS = {
+    HaarDetector.name: HaarDetector,
+    LbpDetector.name: LbpDetector,
+    DnnDetector.name: DnnDetector,
+}
+
+_detectors = {}
+_detectors_lock = threading.Lock()
+
+
+def size_limits(frame_size=ANALYSIS_SIZE, min_area=MIN_AREA_PERCENT, margin=DETECTOR_MIN_SIZE_MARGIN,
+                search_min_face=DETECTOR_SEARCH_MIN_FACE, floor=(30, 30)):
+    """Параметры поиска каскада по порогу площади лица: min_size, max_size и search_scale.
+
+    Рамка каскада квадратная, поэтому лицо проходит порог, если его сторона не
+    меньше sqrt(min_area * площадь кадра). Лицо не больше меньшей стороны кадра.
+    """
+    width, height = frame_size
+    side = int(math.sqrt(min_area * width * height) * margin)
+    min_size = (max(side, floor[0]), max(side, floor[1]))
+    max_size = (min(width, height), min(width, height))
+    search_scale = 1.0
+    if search_min_face and min_size[0] > search_min_face:
+        search_scale = min_size[0] / search_min_face
+    return {"min_size": min_size, "max_size": max_size, "search_scale": search_scale}
+
+
+def create_detector(backend=DETECTOR_BACKEND, **kwargs):
+    """Создание нового экземпляра детектора выбранного бэкенда.
+
+    Каскадам без явно заданных границ размера передаются границы из size_limits.
+    """
+    if backend not in BACKENDS:
+        raise Exception(f"Неизвестный бэкенд детектора: {backend}")
+    cls = BACKENDS[backend]
+    if DETECTOR_SIZE_PRUNING and getattr(cls, "supports_size_limits", False) and "min_size" not in kwargs:
+        kwargs = {**size_limits(), **kwargs}
+    return cls(**kwargs)
+
+
+def get_detector(backend=DETECTOR_BACKEND):
+    """Общий экземпляр детектора: модель загружается один раз на процесс."""
+    with _detectors_lock:
+        if backend not in _detectors:
+            _detectors[backend] = create_detector(backend)
+        return _detectors[backend]
@@ -1,48 +1,42 @@
+import cv2
 import pygame
 import pygame.gfxdraw
-import os
-from gtts import gTTS
-from config import DISPLAY_WIDTH, DISPLAY_HEIGHT, AUDIO_PATH, FULLSCREEN_MODE, ALLOWED_TTS, DOSSIER_DISPLAY_DURATION, \
+from config import DISPLAY_WIDTH, DISPLAY_HEIGHT, FULLSCREEN_MODE, ALLOWED_TTS, DOSSIER_DISPLAY_DURATION, \
     DOSSIERS_TEXT, DOSSIERS_TEXT_LOCATION, QR_TEXT, TEXT_SPEED
 import logging
-import asyncio
 import math
+import time
 from datetime import datetime
 from camera import init_camera
-
-# Настройка логирования
-logging.basicConfig(filename='app.log', level=logging.DEBUG,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+from compositor import ResultCompositor
+from scheduler import ui_scheduler
+from sprites import SpriteCache
+from text_layout import layout_engine
+import tts
+from audio import audio_engine
+
+# Скорость вращения спиннера, градусов в секунду
+SPINNER_SPEED = 200
+
+# Шрифты по ключу (имя, размер, жирность)
+_fonts = {}
+
+def get_font(size, bold=False, name="arial"):
+    """Системный шрифт из кэша: поиск шрифта и кэши ширин слов не повторяются на каждом экране."""
+    key = (name, size, bold)
+    if key not in _fonts:
+        _fonts[key] = pygame.font.SysFont(name, size, bold=bold)
+    return _fonts[key]
 
 def wrap_text(text, font, max_width):
     """Перенос текста для ограничения ширины с поддержкой переносов строк."""
-    lines = []
-    for paragraph in text.split('\n'):
-        if not paragraph:
-            lines.append("")
-            continue
-        words = paragraph.split(" ")
-        current_line = ""
-        for word in words:
-            test_line = f"{current_line}{word} "
-            test_surface = font.render(test_line.strip(), True, (255, 255, 255))
-            if test_surface.get_width() <= max_width:
-                current_line = test_line
-            else:
-                if current_line:
-                    lines.append(current_line.strip())
-                current_line = f"{word} "
-        if current_line:
-            lines.append(current_line.strip())
+    return layout_engine.wrap(text, font, max_width)
 
-    surfaces = []
-    for line in lines:
-        if line:
-            surfaces.append(font.render(line, True, (255, 255, 255)))
-        else:
-            surfaces.append(None)
-
-    return surfaces
+def frame_to_surface(frame, size):
+    """Поверхность pygame прямо из кадра OpenCV (BGR), без промежуточного файла."""
+    resized = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    rgb = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+    return pygame.image.frombuffer(rgb, size, "RGB").convert()
 
 def draw_spinner(screen, center, radius, angle):
     """Отрисовка спиннера."""
@@ -80,6 +74,10 @@ def draw_progress_ring(screen, center, radius, thickness, progress):
             (255, 255, 255)
         )
 
+# Кадры спиннера и кольца прогресса рисуются один раз и дальше только копируются
+spinner_sprites = SpriteCache((72, 72), lambda surface, center, fraction: draw_spinner(surface, center, 30, fraction * 360), 90)
+ring_sprites = SpriteCache((84, 84), lambda surface, center, fraction: draw_progress_ring(surface, center, 40, 6, fraction), 180)
+
 async def check_events():
     """Асинхронная проверка событий выхода (Ctrl+Q или ESC)."""
     for event in pygame.event.get():
@@ -95,42 +93,46 @@ async def check_events():
                 return False
     return True
 
-async def show_waiting_screen(screen, font, angle):
-    """Экран ожидания с асинхронным вращающимся спиннером."""
-    current_angle = angle
-    screen.fill((0, 0, 0))
-    text = font.render("Ожидаем человека в кадре", True, (255, 255, 255))
-    text_rect = text.get_rect(center=(DISPLAY_WIDTH // 2, DISPLAY_HEIGHT // 2 - 50))
-    screen.blit(text, text_rect)
-    draw_spinner(screen, (DISPLAY_WIDTH // 2, DISPLAY_HEIGHT // 2 + 50), 30, current_angle)
-    pygame.display.flip()
-
-    current_angle = (current_angle + 2) % 360
-    if not await check_events():
-        return current_angle, False
-    await asyncio.sleep(0.01)
+# Сообщение экрана со спиннером, который уже выведен целиком; дальше обновляется только спиннер
+_spinner_screen_message = None
 
-    return current_angle, True
+def invalidate_spinner_screen():
+    """Следующий экран со спиннером будет перерисован целиком."""
+    global _spinner_screen_message
+    _spinner_screen_message = None
 
-async def show_api_loading_screen(screen, font, angle):
-    """Экран загрузки API с асинхронным вращающимся спиннером."""
-    current_angle = angle
-    screen.fill((0, 0, 0))
-    text = font.render("Генерируем досье...", True, (255, 255, 255))
-    text_rect = text.get_rect(center=(DISPLAY_WIDTH // 2, DISPLAY_HEIGHT // 2 - 50))
-    screen.blit(text, text_rect)
-    draw_spinner(screen, (DISPLAY_WIDTH // 2, DISPLAY_HEIGHT // 2 + 50), 30, current_angle)
-    pygame.display.flip()
+async def _show_spinner_screen(screen, font, angle, message, wake):
+    global _spinner_screen_message
+    spinner_center = (DISPLAY_WIDTH // 2, DISPLAY_HEIGHT // 2 + 50)
+    if _spinner_screen_message != message:
+        screen.fill((0, 0, 0))
+        text = layout_engine.render(font, message)
+        text_rect = text.get_rect(center=(DISPLAY_WIDTH // 2, DISPLAY_HEIGHT // 2 - 50))
+        screen.blit(text, text_rect)
+        spinner_sprites.blit(screen, spinner_center, angle / 360)
+        pygame.display.flip()
+        _spinner_screen_message = message
+    else:
+        pygame.display.update(spinner_sprites.blit(screen, spinner_center, angle / 360))
 
-    current_angle = (current_angle + 2) % 360
+    current_angle = (angle + SPINNER_SPEED * ui_scheduler.period) % 360
     if not await check_events():
         return current_angle, False
-    await asyncio.sleep(0.01)
+    await ui_scheduler.next_frame(wake)
 
     return current_angle, True
 
+async def show_waiting_screen(screen, font, angle, wake=None):
+    """Экран ожидания с асинхронным вращающимся спиннером; wake — задача, завершение которой будит цикл раньше."""
+    return await _show_spinner_screen(screen, font, angle, "Ожидаем человека в кадре", wake)
+
+async def show_api_loading_screen(screen, font, angle, wake=None):
+    """Экран загрузки API с асинхронным вращающимся спиннером."""
+    return await _show_spinner_screen(screen, font, angle, "Генерируем досье...", wake)
+
 async def show_error(screen, font, message, duration=5):
     """Отображение сообщения об ошибке на экране."""
+    invalidate_spinner_screen()
     screen.fill((0, 0, 0))
     lines = wrap_text(message, font, DISPLAY_WIDTH - 40)
     for i, surface in enumerate(lines):
@@ -143,201 +145,217 @@ async def show_error(screen, font, message, duration=5):
     while (pygame.time.get_ticks() / 1000) - start_time < duration:
         if not await check_events():
             return False
-        await asyncio.sleep(0.01)
+        await ui_scheduler.next_frame()
 
     logging.info(f"Отображено сообщение об ошибке: {message}")
     return True
 
-def show_result(screen, photo_path, dossier, request_number):
-    """Отображение фото и досье на экране с опциональным озвучиванием и скроллингом текста во время появления."""
-    font = pygame.font.SysFont("arial", 36)
-    bold_font = pygame.font.SysFont("arial", 36, bold=True)
-    timer_font = pygame.font.SysFont("arial", 24)
-    qr_prompt_font = pygame.font.SysFont("arial", 30)
+class StreamingText:
+    """Инкрементальная раскладка поступающего текста: переносятся только новые абзацы.
+
+    Строки завершенных абзацев раскладываются один раз; последний,
+    еще не законченный абзац перераскладывается при каждом новом фрагменте.
+    Жадный перенос не меняет уже сформированные строки при дописывании
+    текста, поэтому окончательными считаются все строки, кроме последней
+    строки незаконченного абзаца.
+    """
+
+    def __init__(self, font, max_width):
+        self.font = font
+        self.max_width = max_width
+        self._lines = []
+        self._tail = []
+        self._consumed = 0
+        self.finished = False
+
+    def update(self, text, finished):
+        end = len(text) if finished else text.rfind("\n") + 1
+        if end > self._consumed:
+            block = text[self._consumed:end]
+            self._lines.extend(wrap_text(block[:-1] if block.endswith("\n") else block, self.font, self.max_width))
+            self._consumed = end
+        tail = text[self._consumed:]
+        self._tail = wrap_text(tail, self.font, self.max_width) if tail else []
+        self.finished = finished
+
+    @property
+    def lines(self):
+        """Все строки, включая последнюю строку незаконченного абзаца."""
+        return self._lines + self._tail
+
+    @property
+    def ready_lines(self):
+        """Строки, которые уже не изменятся."""
+        return self._lines + self._tail if self.finished else self._lines + self._tail[:-1]
+
+class SpeechPlayer:
+    """Воспроизведение фрагментов речи по порядку, как только очередной фрагмент синтезирован."""
+
+    def __init__(self, queue, engine):
+        self.queue = queue
+        self.engine = engine
+        self._index = 0
+
+    def update(self):
+        """Передача следующего готового фрагмента в очередь канала; вызывается каждый кадр."""
+        segments = self.queue.segments
+        while self.engine.can_enqueue() and self._index < len(segments) and segments[self._index].done():
+            future = segments[self._index]
+            self._index += 1
+            try:
+                self.engine.enqueue(future.result())
+            except Exception as e:
+                # Фрагмент, который не удалось синтезировать или проиграть, пропускается
+                logging.error(f"Ошибка создания или воспроизведения аудио: {str(e)}")
+
+    def finished(self):
+        """Весь текст получен, все фрагменты проиграны."""
+        if not self.queue.complete or self._index < len(self.queue.segments):
+            return False
+        return not self.engine.busy()
+
+    def stop(self):
+        self.engine.stop()
+
+
+async def show_result(screen, photo, dossier, request_number):
+    """Отображение фото и досье на экране с опциональным озвучиванием и скроллингом текста во время появления.
+
+    dossier — DossierStream: строки появляются по мере поступления текста из API.
+    Номер запроса может прийти в любом фрагменте; шапка перестраивается, когда он известен.
+    """
+    font = get_font(36)
+    bold_font = get_font(36, bold=True)
+    timer_font = get_font(24)
+    qr_prompt_font = get_font(30)
 
     qr_prompt_text = QR_TEXT
     qr_prompt_lines = wrap_text(qr_prompt_text, qr_prompt_font, DISPLAY_WIDTH // 2 - 140)
 
     try:
-        image = pygame.image.load(photo_path)
-        image = pygame.transform.scale(image, (DISPLAY_WIDTH // 2, DISPLAY_HEIGHT))
-        logging.info(f"Фото загружено: {photo_path}")
+        image = frame_to_surface(photo, (DISPLAY_WIDTH // 2, DISPLAY_HEIGHT))
+        logging.info("Фото подготовлено к показу")
     except Exception as e:
         logging.error(f"Ошибка загрузки фото: {str(e)}")
         return False
 
-    header_text = f"{DOSSIERS_TEXT} {request_number}\\{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n{DOSSIERS_TEXT_LOCATION}\n"
-    header_surfaces = wrap_text(header_text, bold_font, DISPLAY_WIDTH // 2 - 40)
+    shown_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def header(number):
+        header_text = f"{DOSSIERS_TEXT} {number if number is not None else ''}\\{shown_at}\n{DOSSIERS_TEXT_LOCATION}\n"
+        return wrap_text(header_text, bold_font, DISPLAY_WIDTH // 2 - 40)
+
+    header_number = request_number if request_number is not None else dossier.request_number
+    header_surfaces = header(header_number)
 
     max_text_width = DISPLAY_WIDTH // 2 - 40
-    text_surfaces = wrap_text(dossier, font, max_text_width)
-
-    if ALLOWED_TTS:
-        try:
-            tts = gTTS(text=dossier, lang="ru", tld="ru")
-            os.makedirs(os.path.dirname(AUDIO_PATH), exist_ok=True)
-            tts.save(AUDIO_PATH)
-            logging.info(f"Аудиофайл создан: {AUDIO_PATH}")
-
-            pygame.mixer.init()
-            pygame.mixer.music.load(AUDIO_PATH)
-            pygame.mixer.music.play()
-            logging.info("Аудио воспроизводится")
-        except Exception as e:
-            logging.error(f"Ошибка создания или воспроизведения аудио: {str(e)}")
-            return False
+    layout = StreamingText(font, max_text_width)
+    layout_version = None
+
+    # Предложения синтезируются параллельно по мере поступления текста,
+    # воспроизведение начинается с первого готового
+    speech = None
+    if ALLOWED_TTS and audio_engine.started:
+        speech = SpeechPlayer(tts.SpeechQueue(tts.get_synthesizer(), audio_engine.load), audio_engine)
 
     header_height = sum(surface.get_height() if surface else 40 for surface in header_surfaces)
     scroll_area_top = header_height + 20 + 1
     scroll_area_bottom = DISPLAY_HEIGHT - 160  # Увеличиваем буфер до 160, чтобы таймер не перекрывал текст
     scroll_area_height = scroll_area_bottom - scroll_area_top
     scroll_rect = pygame.Rect(20, scroll_area_top, max_text_width, scroll_area_height)
-    scroll_surface = screen.subsurface(scroll_rect)
-    text_height = sum(surface.get_height() if surface else 40 for surface in text_surfaces)
-    max_scroll = max(0, text_height - scroll_area_height)
-    scroll_offset = 0
     scroll_speed = 2  # Увеличиваем скорость скроллинга для более быстрого смещения
 
+    # Фото и шапка собираются один раз, дальше на экран уходят только изменения
+    invalidate_spinner_screen()
+    compositor = ResultCompositor(screen, image, (DISPLAY_WIDTH // 2, 0), header_surfaces, (20, 20), scroll_rect)
+    compositor.present_all()
+
     running = True
     line_index = 0
     alpha = 0
-    header_alpha = 255
-    while running and line_index < len(text_surfaces):
-        screen.fill((0, 0, 0))
-        scroll_surface.fill((0, 0, 0))  # Очищаем область скроллинга
-        screen.blit(image, (DISPLAY_WIDTH // 2, 0))
+    # Пауза TEXT_SPEED между строками выдерживается по времени, не останавливая цикл событий
+    hold_until = 0.0
+    while running:
+        if dossier.version != layout_version:
+            layout_version = dossier.version
+            layout.update(dossier.text, dossier.done())
+        text_surfaces = layout.ready_lines
+        compositor.begin_frame()
+        if header_number is None and dossier.request_number is not None:
+            header_number = dossier.request_number
+            compositor.set_header(header(header_number))
+        if layout.finished and line_index >= len(text_surfaces):
+            break
 
-        y_offset = 20
-        for surface in header_surfaces:
-            if surface:
-                surface.set_alpha(header_alpha)
-                screen.blit(surface, (20, y_offset))
-                y_offset += surface.get_height()
-            else:
-                y_offset += 40
-
-        # Проверяем, превысит ли следующая строка область таймера
-        current_y = 1
-        next_line_y = y_offset + 1 + line_index * 40
-        if line_index < len(text_surfaces) and next_line_y + (40 if not text_surfaces[line_index] else text_surfaces[line_index].get_height()) > scroll_area_bottom:
-            scroll_offset = min(scroll_offset + scroll_speed, max_scroll)
-
-        for i in range(line_index):
-            if i < len(text_surfaces) and text_surfaces[i]:
-                surface = text_surfaces[i]
-                surface.set_alpha(255)
-                scroll_surface.blit(surface, (0, current_y - scroll_offset))
-                current_y += surface.get_height()
-            else:
-                current_y += 40
-
-        if line_index < len(text_surfaces) and text_surfaces[line_index]:
-            text_surfaces[line_index].set_alpha(alpha)
-            scroll_surface.blit(text_surfaces[line_index], (0, current_y - scroll_offset))
-            alpha += 10
-            if alpha >= 255:
-                alpha = 0
-                line_index += 1
-                pygame.time.wait(TEXT_SPEED)
-        else:
-            line_index += 1  # Пропускаем пустую строку
-            pygame.time.wait(TEXT_SPEED)
+        if speech is not None:
+            speech.queue.feed(dossier.text, dossier.done())
+            speech.update()
 
-        pygame.display.flip()
+        if line_index < len(text_surfaces) and time.monotonic() >= hold_until:
+            surface = text_surfaces[line_index]
+            # Прокручиваем, если появляющаяся строка выходит за нижнюю границу области текста
+            line_bottom = compositor.text_height + compositor.line_height(surface)
+            if line_bottom - compositor.scroll_offset > scroll_area_height:
+                compositor.scroll_to(min(compositor.scroll_offset + scroll_speed, line_bottom - scroll_area_height))
 
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_q and event.mod & pygame.KMOD_CTRL:
-                    logging.info("Выход по Ctrl+Q")
-                    running = False
-                if event.key == pygame.K_ESCAPE:
-                    logging.info("Выход по ESC")
-                    running = False
+            if surface:
+                alpha += 10
+                if alpha >= 255:
+                    alpha = 0
+                    line_index += 1
+                    compositor.append_line(surface)
+                    hold_until = time.monotonic() + TEXT_SPEED / 1000
+                else:
+                    compositor.draw_fading_line(surface, alpha)
+            else:
+                line_index += 1  # Пропускаем пустую строку
+                compositor.append_line(None)
+                hold_until = time.monotonic() + TEXT_SPEED / 1000
+        compositor.present()
 
-        pygame.time.wait(20)
+        running = await check_events()
+        await ui_scheduler.next_frame()
 
     if not running:
-        if ALLOWED_TTS:
-            pygame.mixer.music.stop()
-            pygame.mixer.quit()
+        if speech is not None:
+            speech.stop()
         return False
 
-    if ALLOWED_TTS:
-        while pygame.mixer.music.get_busy():
-            screen.fill((0, 0, 0))
-            scroll_surface.fill((0, 0, 0))
-            screen.blit(image, (DISPLAY_WIDTH // 2, 0))
-            y_offset = 20
-            for surface in header_surfaces:
-                if surface:
-                    surface.set_alpha(255)
-                    screen.blit(surface, (20, y_offset))
-                    y_offset += surface.get_height()
-                else:
-                    y_offset += 40
-            current_y = 1
-            for surface in text_surfaces:
-                if surface:
-                    scroll_surface.blit(surface, (0, current_y - scroll_offset))
-                    current_y += surface.get_height()
-                else:
-                    current_y += 40
-            pygame.display.flip()
-
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_q and event.mod & pygame.KMOD_CTRL:
-                        logging.info("Выход по Ctrl+Q")
-                        running = False
-                    if event.key == pygame.K_ESCAPE:
-                        logging.info("Выход по ESC")
-                        running = False
-            if not running:
-                break
-            pygame.time.wait(20)
+    if speech is not None:
+        speech.queue.feed(dossier.text, True)
+        # Экран не меняется, пока звучит речь: перерисовка не нужна
+        while running and not speech.finished():
+            speech.update()
+            running = await check_events()
+            await ui_scheduler.next_frame()
 
         if not running:
-            pygame.mixer.music.stop()
-            pygame.mixer.quit()
+            speech.stop()
             return False
 
+    # Подсказка с QR-кодом статична и выводится один раз
+    qr_x_offset = 120
+    qr_y_center = DISPLAY_HEIGHT - 60
+    total_qr_height = len(qr_prompt_lines) * 30
+    qr_y_offset = qr_y_center - total_qr_height // 2
+    for i, surface in enumerate(qr_prompt_lines):
+        if surface:
+            compositor.blit(surface, surface.get_rect(left=qr_x_offset, top=qr_y_offset + i * 30))
+
+    ring_center = (60, DISPLAY_HEIGHT - 60)
+
     total_duration = DOSSIER_DISPLAY_DURATION
     start_time = pygame.time.get_ticks() / 1000
     last_second = -1
     timer_surface = None
     while (pygame.time.get_ticks() / 1000) - start_time < total_duration:
-        screen.fill((0, 0, 0))
-        scroll_surface.fill((0, 0, 0))
-        screen.blit(image, (DISPLAY_WIDTH // 2, 0))
-
-        y_offset = 20
-        for surface in header_surfaces:
-            if surface:
-                surface.set_alpha(255)
-                screen.blit(surface, (20, y_offset))
-                y_offset += surface.get_height()
-            else:
-                y_offset += 40
-
-        # Отрисовка текста без скроллинга
-        current_y = 1
-        for surface in text_surfaces:
-            if surface:
-                scroll_surface.blit(surface, (0, current_y - scroll_offset))
-                current_y += surface.get_height()
-            else:
-                current_y += 40
-
+        compositor.begin_frame()
         elapsed = (pygame.time.get_ticks() / 1000) - start_time
         remaining_time = max(0, total_duration - elapsed)
         progress = remaining_time / total_duration
 
-        ring_center = (60, DISPLAY_HEIGHT - 60)
-        draw_progress_ring(screen, ring_center, 40, 6, progress)
+        # Меняется только кольцо с таймером; кадры кольца берутся из кэша
+        compositor.mark_dirty(ring_sprites.blit(screen, ring_center, progress))
 
         seconds = int(remaining_time)
         if seconds != last_second:
@@ -347,37 +365,18 @@ def show_result(screen, photo_path, dossier, request_number):
         if timer_surface:
             timer_rect = timer_surface.get_rect(center=ring_center)
             screen.blit(timer_surface, timer_rect)
+        compositor.present()
 
-        qr_x_offset = 120
-        qr_y_center = DISPLAY_HEIGHT - 60
-        total_qr_height = len(qr_prompt_lines) * 30
-        qr_y_offset = qr_y_center - total_qr_height // 2
-        for i, surface in enumerate(qr_prompt_lines):
-            if surface:
-                qr_rect = surface.get_rect(left=qr_x_offset, top=qr_y_offset + i * 30)
-                screen.blit(surface, qr_rect)
-
-        pygame.display.flip()
-
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_q and event.mod & pygame.KMOD_CTRL:
-                    logging.info("Выход по Ctrl+Q")
-                    running = False
-                if event.key == pygame.K_ESCAPE:
-                    logging.info("Выход по ESC")
-                    running = False
+        running = await check_events()
         if not running:
             break
-        pygame.time.wait(20)
-
-    if ALLOWED_TTS:
-        pygame.mixer.music.stop()
-        pygame.mixer.quit()
-        if os.path.exists(AUDIO_PATH):
-            os.remove(AUDIO_PATH)
-            logging.info(f"Аудиофайл удален: {AUDIO_PATH}")
-    logging.info("Отображение результата завершено")
+        await ui_scheduler.next_frame()
+
+    if speech is not None:
+        speech.stop()
+        audio_stats = audio_engine.stats()
+        logging.info(f"Озвучивание: запусков {audio_stats['plays']}, задержка до первого сэмпла "
+                     f"{audio_stats['latency_ms']:.1f} мс (макс. {audio_stats['latency_max_ms']:.1f} мс)")
+    logging.info(f"Отображение результата завершено, кадров: {compositor.frames}, "
+                 f"среднее время кадра: {compositor.mean_frame_ms():.2f} мс")
     return running
@@ -0,0 +1,133 @@
+import cv2
+import logging
+import threading
+import time
+from collections import OrderedDict
+import metrics
+from best_frame import face_roi
+from settings import DOSSIER_CACHE_ENABLED, DOSSIER_CACHE_TTL, DOSSIER_CACHE_MAX_ENTRIES, DOSSIER_CACHE_MAX_DISTANCE
+
+
+def face_signature(frame, face):
+    """Перцептивный хэш лица (64 бита): знаки низких частот DCT уменьшенной рамки относительно медианы.
+
+    Берутся первые 64 коэффициента блока 8x9 без постоянной составляющей:
+    она зависит только от яркости и в сравнении не участвует.
+
+    Хэш не зависит от разрешения кадра и мало меняется от кадра к кадру у
+    одного и того же лица; None, если рамка пуста.
+    """
+    roi = face_roi(frame, face)
+    if roi.size == 0:
+        return None
+    small = cv2.resize(roi, (32, 32), interpolation=cv2.INTER_AREA).astype("float32")
+    low = cv2.dct(small)[:8, :9].flatten()[1:65]
+    median = sorted(low)[31]
+    signature = 0
+    for value in low:
+        signature = (signature << 1) | int(value > median)
+    return signature
+
+
+def distance(a, b):
+    """Расстояние Хэмминга между сигнатурами."""
+    return bin(a ^ b).count("1")
+
+
+class DossierCache:
+    """Досье недавних посетителей по сигнатуре лица.
+
+    Поиск — ближайшая сигнатура не дальше max_distance бит; записи живут
+    ttl секунд, при переполнении вытесняется давно не использованная.
+    Кэш маленький (десятки лиц), поэтому перебор всех записей дешевле индекса.
+    """
+
+    def __init__(self, ttl=DOSSIER_CACHE_TTL, max_entries=DOSSIER_CACHE_MAX_ENTRIES,
+                 max_distance=DOSSIER_CACHE_MAX_DISTANCE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self._entries = OrderedDict()  # сигнатура -> (время записи, текст, номер запроса)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.lookups = 0
+        self.lookup_time = 0.0
+
+    def lookup(self, frame, face):
+        """Поиск досье по лицу: (сигнатура, текст, номер запроса); текст None при промахе.
+
+        Попадания и промахи здесь не считаются: за цикл поиск может пройти и по
+        упреждающему, и по окончательному снимку, а учитывается один посетитель (record).
+        """
+        start = time.perf_counter()
+        signature = face_signature(frame, face) if face is not None else None
+        found = None
+        if signature is not None:
+            now = time.monotonic()
+            with self._lock:
+                best_distance = self.max_distance + 1
+                for key, entry in list(self._entries.items()):
+                    if now - entry[0] > self.ttl:
+                        del self._entries[key]
+                        continue
+                    key_distance = distance(signature, key)
+                    if key_distance < best_distance:
+                        best_distance, found = key_distance, key
+                if found is not None:
+                    self._entries.move_to_end(found)
+                    _, text, request_number = self._entries[found]
+        elapsed = time.perf_counter() - start
+        metrics.DOSSIER_CACHE_LOOKUP.observe(elapsed)
+        with self._lock:
+            self.lookups += 1
+            self.lookup_time += elapsed
+        if found is None:
+            return signature, None, None
+        logging.info(f"Досье найдено в кэше, расстояние сигнатур {best_distance}")
+        return signature, text, request_number
+
+    def record(self, hit):
+        """Учет посетителя цикла: досье показано из кэша (hit) или запрошено у API."""
+        with self._lock:
+            if hit:
+                self.hits += 1
+                metrics.DOSSIER_CACHE_HITS.inc()
+            else:
+                self.misses += 1
+                metrics.DOSSIER_CACHE_MISSES.inc()
+            metrics.DOSSIER_CACHE_HIT_RATIO.set(self.hits / (self.hits + self.misses))
+
+    def put(self, signature, text, request_number):
+        if signature is None or not text:
+            return
+        with self._lock:
+            self._entries[signature] = (time.monotonic(), text, request_number)
+            self._entries.move_to_end(signature)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """Попадания, промахи и доля попаданий по посетителям, средняя задержка поиска."""
+        with self._lock:
+            visitors = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / visitors if visitors else 0.0,
+                "lookup_ms": self.lookup_time / self.lookups * 1000 if self.lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+_cache = DossierCache() if DOSSIER_CACHE_ENABLED else None
+
+
+def use_cache(cache):
+    """Замена кэша досье; None отключает кэш (нагрузочный прогон по одному лицу)."""
+    global _cache
+    _cache = cache
+
+
+def get_cache():
+    return _cache
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import re
+import time
+
+import metrics
+
+# Клиент API досье; по умолчанию модуль api_client, в нагрузочном прогоне — заглушка
+_client = None
+
+
+def use_client(client):
+    """Замена клиента API объектом с теми же get_dossier/stream_dossier."""
+    global _client
+    _client = client
+
+
+def get_client():
+    global _client
+    if _client is None:
+        import api_client
+        _client = api_client
+    return _client
+
+
+class DossierStream:
+    """Досье, текст которого поступает частями.
+
+    Источник — асинхронный итератор пар (фрагмент текста, номер запроса);
+    номер может быть None во всех фрагментах, кроме одного. Фоновая задача
+    вычитывает источник сразу после создания объекта, экран результата
+    читает накопленный текст через text. Для досье из кэша (cached=True)
+    задержки API не записываются.
+    """
+
+    def __init__(self, chunks, cached=False):
+        self.cached = cached
+        self._chunks = []
+        self.request_number = None
+        self.error = None
+        self.version = 0  # растет с каждым новым фрагментом
+        self._finished = False
+        self.first_chunk = asyncio.Event()
+        self._task = asyncio.create_task(self._pump(chunks))
+
+    async def _pump(self, chunks):
+        start = time.perf_counter()
+        try:
+            async for chunk, request_number in chunks:
+                if request_number is not None:
+                    self.request_number = request_number
+                if chunk:
+                    self._chunks.append(chunk)
+                    self.version += 1
+                if not self.first_chunk.is_set() and not self.cached:
+                    metrics.DOSSIER_FIRST_CHUNK.observe(time.perf_counter() - start)
+                self.first_chunk.set()
+            if not self.cached:
+                metrics.DOSSIER_ROUND_TRIP.observe(time.perf_counter() - start)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.error = e
+            metrics.API_FAILURES.inc()
+            logging.error(f"Ошибка получения досье: {str(e)}")
+        finally:
+            self._finished = True
+            self.version += 1
+            self.first_chunk.set()
+
+    @property
+    def text(self):
+        """Накопленный текст с удаленными пустыми строками."""
+        text = re.sub(r'\n\s*\n+', '\n', "".join(self._chunks).lstrip())
+        return text.rstrip() if self._finished else text
+
+    def done(self):
+        return self._finished
+
+    def cancel(self):
+        self._task.cancel()
+
+
+async def replay_chunks(text, request_number):
+    """Сохраненное досье одним фрагментом."""
+    yield text, request_number
+
+
+async def request_chunks(photo_path, api_key, api_scope):
+    """Фрагменты досье из API.
+
+    Если api_client предоставляет потоковый вариант stream_dossier (асинхронный
+    итератор пар (фрагмент, номер запроса)), используется он; иначе весь ответ
+    get_dossier отдается одним фрагментом.
+    """
+    client = get_client()
+    stream_dossier = getattr(client, "stream_dossier", None)
+    if stream_dossier is not None:
+        async for chunk, request_number in stream_dossier(photo_path, api_key, api_scope):
+            yield chunk, request_number
+    else:
+        dossier, request_number = await client.get_dossier(photo_path, api_key, api_scope)
+        yield dossier, request_number
@@ -0,0 +1,118 @@
+import time
+from multiprocessing import shared_memory
+import numpy as np
+
+# Заголовок слота: счетчик версии (нечетный — идет запись), форма кадра и результат детекции
+SLOT_HEADER = np.dtype([
+    ("seq", "<u8"),
+    ("height", "<u4"),
+    ("width", "<u4"),
+    ("channels", "<u4"),
+    ("detected", "u1"),
+    ("face", "<i4", 4),
+    ("timestamp", "<f8"),
+], align=True)
+ALIGNMENT = 64
+
+
+def _data_offset(slots):
+    size = SLOT_HEADER.itemsize * slots
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class FrameRing:
+    """Кольцевой буфер кадров в multiprocessing.shared_memory.
+
+    Один писатель (процесс захвата) копирует кадр в очередной слот и получает
+    (слот, версия); читатель по этой паре обращается к данным прямо в общей
+    памяти, без сериализации через очередь. Версия слота работает как
+    seqlock: если за время чтения слот перезаписан, read возвращает None.
+    """
+
+    def __init__(self, shm, slots, slot_bytes, owner):
+        self.shm = shm
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.owner = owner
+        self.headers = np.ndarray((slots,), dtype=SLOT_HEADER, buffer=shm.buf)
+        self._data_offset = _data_offset(slots)
+        self._next = 0
+        self.writes = 0
+        self.write_time = 0.0
+
+    @classmethod
+    def create(cls, slots, slot_bytes):
+        shm = shared_memory.SharedMemory(create=True, size=_data_offset(slots) + slots * slot_bytes)
+        ring = cls(shm, slots, slot_bytes, owner=True)
+        ring.headers[:] = np.zeros(slots, dtype=SLOT_HEADER)
+        return ring
+
+    @classmethod
+    def attach(cls, name, slots, slot_bytes):
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # До Python 3.13 подключение регистрирует память в resource_tracker.
+            # Дочерний процесс multiprocessing пользуется тем же трекером, что и
+            # создатель, поэтому повторная регистрация ничего не меняет; снимать
+            # ее нельзя — пропала бы регистрация создателя
+            shm = shared_memory.SharedMemory(name=name)
+        return cls(shm, slots, slot_bytes, owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def _view(self, slot, shape):
+        offset = self._data_offset + slot * self.slot_bytes
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf, offset=offset)
+
+    def write(self, frame, face=None):
+        """Запись кадра BGR и рамки лица в следующий слот; возвращает (слот, версия)."""
+        if frame.nbytes > self.slot_bytes:
+            raise Exception(f"Кадр {frame.shape} не помещается в слот ({self.slot_bytes} байт)")
+        start = time.perf_counter()
+        slot = self._next
+        self._next = (slot + 1) % self.slots
+        header = self.headers[slot:slot + 1]
+        header["seq"] += 1
+        np.copyto(self._view(slot, frame.shape), frame)
+        header["height"], header["width"] = frame.shape[:2]
+        header["channels"] = frame.shape[2] if frame.ndim == 3 else 1
+        header["detected"] = face is not None
+        header["face"] = face if face is not None else (0, 0, 0, 0)
+        header["timestamp"] = time.monotonic()
+        header["seq"] += 1
+        self.writes += 1
+        self.write_time += time.perf_counter() - start
+        return slot, int(header["seq"][0])
+
+    def read(self, slot, seq, copy=True):
+        """Кадр и рамка лица из слота или (None, None), если слот уже перезаписан.
+
+        С copy=False возвращается представление общей памяти: оно действительно,
+        пока писатель не дошел до этого слота снова.
+        """
+        header = self.headers[slot]
+        if int(header["seq"]) != seq:
+            return None, None
+        height, width, channels = int(header["height"]), int(header["width"]), int(header["channels"])
+        shape = (height, width, channels) if channels > 1 else (height, width)
+        frame = self._view(slot, shape)
+        if copy:
+            frame = frame.copy()
+        face = tuple(int(v) for v in header["face"]) if header["detected"] else None
+        if int(self.headers[slot]["seq"]) != seq:
+            return None, None
+        return frame, face
+
+    def valid(self, slot, seq):
+        """Слот еще хранит версию seq: прочитанное с copy=False представление не испорчено."""
+        return int(self.headers[slot]["seq"]) == seq
+
+    def close(self):
+        # Представления numpy держат буфер; без их удаления close выдаст BufferError
+        self.headers = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
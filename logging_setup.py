@@ -0,0 +1,106 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from settings import LOG_LEVEL, LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_RATE_LIMIT, LOG_RATE_INTERVAL
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+class RateLimitFilter(logging.Filter):
+    """Ограничение повторяющихся сообщений: не больше limit записей с одной строки кода за interval секунд.
+
+    Предупреждения и ошибки проходят всегда. Число отброшенных записей
+    добавляется к первой записи следующего окна.
+    """
+
+    def __init__(self, limit=LOG_RATE_LIMIT, interval=LOG_RATE_INTERVAL):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.limit:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                self._windows[key] = [now, 1, 0]
+            elif window[1] < self.limit:
+                window[1] += 1
+                return True
+            else:
+                window[2] += 1
+                return False
+        if suppressed:
+            record.msg = f"{record.getMessage()} (пропущено похожих сообщений: {suppressed})"
+            record.args = None
+        return True
+
+
+_listener = None
+_file_handler = None
+_forwarders = []
+
+
+def setup_logging(level=LOG_LEVEL, path=LOG_FILE, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT):
+    """Единая настройка журнала: запись в файл с ротацией в фоновом потоке.
+
+    Вызывающий поток только кладет запись в очередь; форматирование и запись
+    на диск выполняет QueueListener. Повторная настройка ничего не делает.
+    """
+    global _listener, _file_handler
+    if _listener is not None:
+        return
+    file_handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                                        encoding="utf-8")
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    # Фильтр стоит перед очередью: отброшенные записи не доходят до фонового потока
+    queue_handler.addFilter(RateLimitFilter())
+
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+    root.addHandler(queue_handler)
+
+    _file_handler = file_handler
+    _listener = logging.handlers.QueueListener(queue_handler.queue, file_handler)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def forward_records(record_queue):
+    """Запись в общий журнал сообщений дочернего процесса, пришедших через multiprocessing.Queue."""
+    listener = logging.handlers.QueueListener(record_queue, _file_handler)
+    listener.start()
+    _forwarders.append(listener)
+
+
+def setup_child_logging(record_queue, level=LOG_LEVEL):
+    """Настройка журнала дочернего процесса: записи уходят в родительский через очередь.
+
+    Ротацией файла занимается только родительский процесс.
+    """
+    queue_handler = logging.handlers.QueueHandler(record_queue)
+    queue_handler.addFilter(RateLimitFilter())
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+    root.addHandler(queue_handler)
+
+
+def shutdown_logging():
+    """Запись оставшихся в очереди сообщений и остановка фонового потока."""
+    global _listener
+    while _forwarders:
+        _forwarders.pop().stop()
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
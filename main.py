@@ -1,67 +1,136 @@
-import re
-
 import camera
-import api_client
+import speculative
+import vision_process
+import dossier_stream
+import dossier_cache
 import display
+import logging_setup
+import metrics
 import config
 import os
 import pygame
 import asyncio
+import functools
 import logging
-from pydantic import BaseModel
-
-class ConfigModel(BaseModel):
-    LOG_LEVEL: str = "INFO"
-
-configLog = ConfigModel()
-
-log_level = getattr(logging, configLog.LOG_LEVEL.upper(), logging.INFO)
-
-logging.basicConfig(
-    filename='app.log',
-    level=log_level,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
-
-async def capture_with_spinner(cap, screen, font, spinner_angle):
-    """Асинхронный захват кадра с одновременной анимацией спиннера."""
-    frame = None
-    while frame is None:
-        # Запускаем захват кадра и анимацию спиннера параллельно
-        capture_task = asyncio.create_task(camera.capture_with_delay(cap))
+import time
+from scheduler import ui_scheduler
+from audio import audio_engine
+from settings import CAMERA_SOURCES, CAMERA_PHOTO_SOURCE, CAMERA_PHOTO_SOURCES, PHOTO_DEBUG_SAVE, SPECULATIVE_SUBMIT, MULTIPROCESS_ENABLED
+
+async def request_dossier(frame, tag="", signature=None):
+    """Кодирование снимка и запрос досье по частям; файл отправки удаляется по завершении запроса.
+
+    Полностью полученное досье сохраняется в кэш под сигнатурой лица.
+    """
+    with metrics.PHOTO_ENCODE.time():
+        data = await asyncio.to_thread(camera.encode_photo, frame)
+        photo_path = camera.write_upload(data, tag=tag)
+    try:
+        chunks = []
+        number = None
+        async for chunk, request_number in dossier_stream.request_chunks(photo_path, config.API_KEY,
+                                                                         config.API_SCOPE):
+            if chunk:
+                chunks.append(chunk)
+            if request_number is not None:
+                number = request_number
+            yield chunk, request_number
+        cache = dossier_cache.get_cache()
+        if cache is not None:
+            cache.put(signature, "".join(chunks), number)
+    finally:
+        if os.path.exists(photo_path):
+            os.remove(photo_path)
+
+
+def submit_photo(frame, tag="", face=None):
+    """Запуск запроса досье по снимку; текст накапливается в DossierStream.
+
+    Если это лицо недавно уже запрашивалось, досье берется из кэша без обращения к API.
+    """
+    signature = None
+    cache = dossier_cache.get_cache()
+    if cache is not None:
+        signature, text, request_number = cache.lookup(frame, face)
+        if text is not None:
+            return dossier_stream.DossierStream(dossier_stream.replay_chunks(text, request_number), cached=True)
+    return dossier_stream.DossierStream(request_dossier(frame, tag, signature))
+
+
+async def capture_with_spinner(capture, screen, font, spinner_angle, on_candidate=None):
+    """Асинхронный захват кадра с одновременной анимацией спиннера.
+
+    capture(on_candidate) — корутина захвата: camera.capture_first по своим
+    камерам или VisionProcess.capture при захвате в отдельном процессе.
+    Возвращает (снимок, рамка лица, камера) вместе с углом спиннера и признаком работы.
+    """
+    photo = None
+    while photo is None:
+        # Запускаем захват кадра со всех камер и анимацию спиннера параллельно
+        capture_task = asyncio.create_task(capture(on_candidate))
         while not capture_task.done():
-            spinner_angle, running = await display.show_waiting_screen(screen, font, spinner_angle)
+            # Кадр спиннера по таймеру планировщика или сразу по завершении захвата
+            spinner_angle, running = await display.show_waiting_screen(screen, font, spinner_angle, capture_task)
             if not running:
                 capture_task.cancel()
                 return None, spinner_angle, False
-            await asyncio.sleep(0)  # Уступаем управление
 
-        frame = await capture_task
-        if frame is None:  # Если выход по ESC
+        photo = await capture_task
+        logging.info(f"Интерфейс во время захвата: {ui_scheduler.stats()}")
+        if photo is None:  # Если выход по ESC
             return None, spinner_angle, False
 
-    return frame, spinner_angle, True
-
+    return photo, spinner_angle, True
 
-async def api_with_spinner(photo_path, api_key, api_scope, screen, font, spinner_angle):
-    """Асинхронный API-запрос с одновременной анимацией спиннера."""
-    api_task = asyncio.create_task(api_client.get_dossier(photo_path, api_key, api_scope))
-    while not api_task.done():
-        spinner_angle, running = await display.show_api_loading_screen(screen, font, spinner_angle)
-        if not running:
-            api_task.cancel()
-            return None, None, spinner_angle, False
-        await asyncio.sleep(0)  # Уступаем управление
 
+async def api_with_spinner(stream, screen, font, spinner_angle):
+    """Ожидание первого фрагмента досье с одновременной анимацией спиннера."""
+    first_chunk = asyncio.create_task(stream.first_chunk.wait())
     try:
-        dossier, request_number = await api_task
-        return dossier, request_number, spinner_angle, True
-    except Exception as e:
-        logging.error(f"Ошибка API в задаче: {str(e)}")
-        return None, None, spinner_angle, True
-
-
-async def main():
+        while not stream.first_chunk.is_set():
+            spinner_angle, running = await display.show_api_loading_screen(screen, font, spinner_angle, first_chunk)
+            if not running:
+                stream.cancel()
+                return False, spinner_angle, False
+    finally:
+        first_chunk.cancel()
+
+    if stream.error is not None and not stream.text:
+        logging.error(f"Ошибка API в задаче: {str(stream.error)}")
+        return False, spinner_angle, True
+    return True, spinner_angle, True
+
+
+def close_capture(cameras, vision):
+    """Освобождение камер этого процесса и остановка процесса захвата."""
+    camera.release_cameras(cameras)
+    if vision is not None:
+        vision.close()
+
+
+async def main(sources=None, max_cycles=None, on_cycle=None):
+    """Основной цикл киоска.
+
+    sources — источники камер вместо настроек, max_cycles — число циклов до
+    завершения, on_cycle(исход, длительность) вызывается после каждого цикла
+    (используются в режиме нагрузочного прогона).
+    """
+    logging_setup.setup_logging()
+    metrics.start()
+
+    camera_sources = sources or CAMERA_SOURCES or [config.CAMERA_SOURCE]
+    # Основные потоки для снимка высокого разрешения задаются только для камер из настроек
+    if sources:
+        photo_sources = None
+    else:
+        photo_sources = CAMERA_PHOTO_SOURCES if CAMERA_SOURCES else [CAMERA_PHOTO_SOURCE]
+    # Захват и детекция в отдельном процессе; запускается до pygame.init,
+    # чтобы дочерний процесс не наследовал состояние SDL
+    vision = vision_process.VisionProcess(camera_sources, photo_sources).start() if MULTIPROCESS_ENABLED else None
+
+    # Микшер открывается один раз на все время работы, до pygame.init
+    if config.ALLOWED_TTS:
+        audio_engine.start()
     # Инициализация Pygame и режима окна
     pygame.init()
     screen = pygame.display.set_mode(
@@ -69,92 +138,110 @@ async def main():
         pygame.FULLSCREEN if config.FULLSCREEN_MODE else 0
     )
     pygame.mouse.set_visible(False)  # Отключение курсора мыши
-    font = pygame.font.SysFont("arial", 36)
+    font = display.get_font(36)
 
-    # # Инициализация камеры
-    # try:
-    #     cap = camera.init_camera(config.CAMERA_SOURCE, config.CAMERA_AUTH)
-    # except Exception as e:
-    #     logging.error(f"Ошибка инициализации камеры: {str(e)}")
-    #     await display.show_error(screen, font, f"Ошибка камеры: {str(e)}")
-    #     pygame.quit()
-    #     return
+    # Сессии камер открываются один раз и сами переподключаются при сбоях
+    cameras = camera.open_cameras(camera_sources, photo_sources) if vision is None else []
+    capture = vision.capture if vision is not None else functools.partial(camera.capture_first, cameras)
 
     # Анимация спиннера
     spinner_angle = 0
 
+    cycle = 0
+    outcome = None
+    cycle_start = None
     while True:
-        # Инициализация камеры
+        if outcome is not None and on_cycle is not None:
+            on_cycle(outcome, time.perf_counter() - cycle_start)
+        cycle += 1
+        if max_cycles is not None and cycle > max_cycles:
+            break
+        outcome = "ok"
+        cycle_start = time.perf_counter()
+
+        # Упреждающая отправка: запрос стартует еще во время отсчета PHOTO_DELAY
+        speculation = speculative.SpeculativeSubmission(submit_photo) if SPECULATIVE_SUBMIT else None
+
+        # Захват кадра с одновременной анимацией спиннера
         try:
-            cap = camera.init_camera(config.CAMERA_SOURCE, config.CAMERA_AUTH)
+            photo, spinner_angle, running = await capture_with_spinner(
+                capture, screen, font, spinner_angle, speculation.candidate if speculation else None
+            )
         except Exception as e:
-            logging.error(f"Ошибка инициализации камеры: {str(e)}")
+            if speculation:
+                speculation.cancel()
+            logging.error(f"Ошибка захвата: {str(e)}")
+            outcome = "capture_error"
             await display.show_error(screen, font, f"Ошибка камеры: {str(e)}")
-            pygame.quit()
-            return
-        # Захват кадра с одновременной анимацией спиннера
-        frame, spinner_angle, running = await capture_with_spinner(cap, screen, font, spinner_angle)
+            continue
         if not running:
-            camera.release_camera(cap)
+            if speculation:
+                speculation.cancel()
+            close_capture(cameras, vision)
+            audio_engine.close()
             pygame.quit()
             logging.info("Программа завершена")
             return
 
-        if frame is not None:
-            # Сохранение фото
-            try:
-                photo_path = camera.save_photo(frame, config.PHOTO_PATH)
-                logging.info(f"Фото сохранено: {photo_path}")
-            except Exception as e:
-                logging.error(f"Ошибка сохранения фото: {str(e)}")
-                await display.show_error(screen, font, f"Ошибка сохранения фото: {str(e)}")
-                continue
-            camera.release_camera(cap)
+        if photo is not None:
+            frame, face, source = photo
+            stream = None
+            if speculation:
+                stream, speculative_frame = speculation.take(source, frame, face)
+                if stream is not None:
+                    # Досье запрошено по этому кадру — его и показываем
+                    frame = speculative_frame
+                    logging.info("Используется упреждающий запрос")
+            if stream is None:
+                stream = submit_photo(frame, face=face)
+            cache = dossier_cache.get_cache()
+            if cache is not None:
+                # Один посетитель — одно попадание или промах, сколько бы поисков ни было за цикл
+                cache.record(stream.cached)
+                logging.info(f"Кэш досье: {cache.stats()}")
+
+            if PHOTO_DEBUG_SAVE:
+                try:
+                    camera.save_photo(frame, config.PHOTO_PATH)
+                except Exception as e:
+                    logging.error(f"Ошибка сохранения фото: {str(e)}")
 
-            # Выполнение API-запроса с одновременной анимацией спиннера
-            dossier = None
-            request_number = None
+            # Ожидание первого фрагмента досье с одновременной анимацией спиннера
             try:
-                dossier, request_number, spinner_angle, running = await api_with_spinner(
-                    photo_path, config.API_KEY, config.API_SCOPE, screen, font, spinner_angle
-                )
+                received, spinner_angle, running = await api_with_spinner(stream, screen, font, spinner_angle)
                 if not running:
-                    camera.release_camera(cap)
+                    close_capture(cameras, vision)
+                    audio_engine.close()
                     pygame.quit()
                     logging.info("Программа завершена во время загрузки")
                     return
             except Exception as e:
                 logging.error(f"Ошибка API: {str(e)}")
+                outcome = "api_error"
                 await display.show_error(screen, font, f"Ошибка API: {str(e)}")
-                if os.path.exists(photo_path):
-                    os.remove(photo_path)
                 continue
 
-            # Если досье получено, отображаем результат
-            if dossier is not None:
+            # Если досье начало поступать, отображаем его по мере получения
+            if received:
                 try:
-                    dossier = re.sub(r'\n\s*\n+', '\n', dossier.strip())
-                    if not display.show_result(screen, photo_path, dossier, request_number):
+                    if not await display.show_result(screen, frame, stream, stream.request_number):
+                        stream.cancel()
                         logging.info("Отображение результата прервано пользователем")
-                        if os.path.exists(photo_path):
-                            os.remove(photo_path)
+                        outcome = "interrupted"
                         continue
                 except Exception as e:
+                    stream.cancel()
                     logging.error(f"Ошибка отображения результата: {str(e)}")
+                    outcome = "display_error"
                     await display.show_error(screen, font, f"Ошибка отображения: {str(e)}")
             else:
+                outcome = "api_error"
                 await display.show_error(screen, font, "Ошибка соединения с API. Попробуйте снова.")
-                if os.path.exists(photo_path):
-                    os.remove(photo_path)
                 continue
 
-            # Удаление временного фото
-            if os.path.exists(photo_path):
-                os.remove(photo_path)
-                logging.info(f"Фото удалено: {photo_path}")
-
     # Освобождение ресурсов
-    camera.release_camera(cap)
+    close_capture(cameras, vision)
+    audio_engine.close()
     pygame.quit()
     logging.info("Программа завершена")
 
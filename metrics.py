@@ -0,0 +1,293 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from settings import METRICS_ENABLED, METRICS_HTTP_PORT, METRICS_TEXTFILE, METRICS_TEXTFILE_INTERVAL
+
+# Границы корзин гистограмм по умолчанию (секунды): от 1 мс до 30 с
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Counter:
+    """Монотонно растущий счетчик."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def state(self):
+        return self.value
+
+    @staticmethod
+    def diff(state, previous):
+        previous = previous or 0
+        return state - previous if state != previous else None
+
+    def merge(self, delta):
+        self.inc(delta)
+
+    def samples(self):
+        return [(f"{self.name}_total", self.value)]
+
+
+class Gauge:
+    """Текущее значение величины."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self):
+        return [(self.name, self.value)]
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами: запись — бинарный поиск и три сложения."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        """Контекстный менеджер: длительность блока записывается в гистограмму."""
+        return _Timer(self)
+
+    def state(self):
+        with self._lock:
+            return tuple(self.counts), self.sum, self.count
+
+    @staticmethod
+    def diff(state, previous):
+        if previous is None:
+            return state if state[2] else None
+        if state[2] == previous[2]:
+            return None
+        return tuple(a - b for a, b in zip(state[0], previous[0])), state[1] - previous[1], state[2] - previous[2]
+
+    def merge(self, delta):
+        counts, total, count = delta
+        with self._lock:
+            for index, bucket in enumerate(counts):
+                self.counts[index] += bucket
+            self.sum += total
+            self.count += count
+
+    def samples(self):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        samples = []
+        cumulative = 0
+        for bound, bucket in zip(self.buckets, counts):
+            cumulative += bucket
+            samples.append((f'{self.name}_bucket{{le="{bound}"}}', cumulative))
+        samples.append((f'{self.name}_bucket{{le="+Inf"}}', count))
+        samples.append((f"{self.name}_sum", total))
+        samples.append((f"{self.name}_count", count))
+        return samples
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Registry:
+    """Набор метрик с выводом в текстовом формате Prometheus."""
+
+    def __init__(self, prefix="kiosk"):
+        self.prefix = prefix
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help_text, *args):
+        full_name = f"{self.prefix}_{name}"
+        with self._lock:
+            metric = self._metrics.get(full_name)
+            if metric is None:
+                metric = cls(full_name, help_text, *args)
+                self._metrics[full_name] = metric
+            return metric
+
+    def counter(self, name, help_text=""):
+        return self._get_or_create(Counter, name, help_text)
+
+    def gauge(self, name, help_text=""):
+        return self._get_or_create(Gauge, name, help_text)
+
+    def histogram(self, name, help_text="", buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, buckets)
+
+    def changes(self, since):
+        """Приращения метрик с прошлого замера для передачи в другой процесс.
+
+        since — состояния прошлого замера (имя -> состояние, в первый раз
+        пустой словарь). Возвращает (приращения для merge, новые состояния).
+        Показатели (gauge) не передаются: это текущие значения своего процесса.
+        """
+        with self._lock:
+            metrics = [metric for metric in self._metrics.values() if metric.kind != "gauge"]
+        changes, states = {}, {}
+        for metric in metrics:
+            state = states[metric.name] = metric.state()
+            delta = metric.diff(state, since.get(metric.name))
+            if delta is not None:
+                changes[metric.name] = delta
+        return changes, states
+
+    def merge(self, changes):
+        """Прибавление приращений, полученных из другого процесса (changes), к своим метрикам."""
+        with self._lock:
+            targets = [(self._metrics.get(name), delta) for name, delta in changes.items()]
+        for metric, delta in targets:
+            if metric is not None:
+                metric.merge(delta)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            if metric.help:
+                lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, value in metric.samples():
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Этапы цикла main.main()
+CAMERA_INIT = registry.histogram("camera_init_seconds", "Открытие камеры")
+FRAME_READ = registry.histogram("frame_read_seconds", "Чтение кадра с устройства")
+DETECTION = registry.histogram("detection_seconds", "Анализ кадра: движение, трекинг, детектор")
+FRAME_SCORE = registry.histogram("frame_score_seconds", "Оценка кадра отсчета для выбора снимка",
+                                 (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01))
+STABLE_FACE_WAIT = registry.histogram("stable_face_wait_seconds", "Стабилизация лица: от начала отсчета до снимка",
+                                      (0.5, 1, 2, 3, 3.25, 3.5, 4, 5, 7.5, 10, 20))
+PHOTO_ENCODE = registry.histogram("photo_encode_seconds", "Кодирование и запись снимка для отправки")
+DOSSIER_FIRST_CHUNK = registry.histogram("dossier_first_chunk_seconds", "Запрос досье: до первого фрагмента")
+DOSSIER_ROUND_TRIP = registry.histogram("dossier_round_trip_seconds", "Запрос досье: до получения всего текста")
+TEXT_LAYOUT = registry.histogram("text_layout_seconds", "Перенос строк текста")
+TTS_SYNTHESIS = registry.histogram("tts_synthesis_seconds", "Синтез одного предложения бэкендом")
+RENDER_FRAME = registry.histogram("render_frame_seconds", "Время отрисовки кадра экрана результата",
+                                  (0.0005, 0.001, 0.002, 0.004, 0.008, 0.016, 0.02, 0.033, 0.05, 0.1))
+
+# Процесс захвата и процесс интерфейса (MULTIPROCESS_ENABLED)
+VISION_EVENT_LATENCY = registry.histogram("vision_event_latency_seconds",
+                                          "Доставка события из процесса захвата в процесс интерфейса",
+                                          (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+FRAME_RING_READ = registry.histogram("frame_ring_read_seconds", "Чтение кадра из общей памяти",
+                                     (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025))
+FRAME_RING_OVERWRITTEN = registry.counter("frame_ring_overwritten", "Кадры, перезаписанные до чтения из общей памяти")
+VISION_CPU = registry.gauge("vision_cpu_utilization", "Загрузка процессора процессом захвата (доля ядра)")
+VISION_FPS = registry.gauge("vision_analysis_fps", "Частота анализа кадров в процессе захвата")
+UI_CPU = registry.gauge("ui_cpu_utilization", "Загрузка процессора процессом интерфейса (доля ядра)")
+
+DETECTIONS = registry.counter("detections", "Кадры с найденным лицом")
+FRAMES_ANALYZED = registry.counter("frames_analyzed", "Проанализированные кадры")
+FRAMES_DROPPED = registry.counter("frames_dropped", "Кадры, перезаписанные до чтения")
+CAMERA_RECONNECTS = registry.counter("camera_reconnects", "Переподключения камер")
+API_FAILURES = registry.counter("api_failures", "Ошибки запроса досье")
+TTS_CACHE_HITS = registry.counter("tts_cache_hits", "Попадания в кэш речи")
+TTS_CACHE_MISSES = registry.counter("tts_cache_misses", "Промахи кэша речи")
+DOSSIER_CACHE_HITS = registry.counter("dossier_cache_hits", "Досье, показанные из кэша без запроса к API")
+DOSSIER_CACHE_MISSES = registry.counter("dossier_cache_misses", "Промахи кэша досье")
+DOSSIER_CACHE_HIT_RATIO = registry.gauge("dossier_cache_hit_ratio", "Доля попаданий в кэш досье с запуска")
+DOSSIER_CACHE_LOOKUP = registry.histogram("dossier_cache_lookup_seconds", "Сигнатура лица и поиск в кэше досье",
+                                          (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Опрос каждые несколько секунд не должен засорять журнал
+        pass
+
+
+def write_textfile(path=METRICS_TEXTFILE):
+    """Атомарная запись метрик для textfile collector node_exporter."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(registry.render())
+    os.replace(tmp_path, path)
+
+
+def _textfile_loop(path, interval):
+    while True:
+        try:
+            write_textfile(path)
+        except OSError as e:
+            logging.error(f"Ошибка записи метрик в {path}: {str(e)}")
+        time.sleep(interval)
+
+
+_started = False
+
+
+def start(port=METRICS_HTTP_PORT, textfile=METRICS_TEXTFILE, interval=METRICS_TEXTFILE_INTERVAL):
+    """Запуск экспорта метрик: HTTP /metrics и/или периодическая запись в файл."""
+    global _started
+    if _started or not METRICS_ENABLED:
+        return
+    _started = True
+    if port:
+        try:
+            server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        except OSError as e:
+            logging.error(f"Не удалось открыть порт метрик {port}: {str(e)}")
+        else:
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+            logging.info(f"Метрики доступны на http://127.0.0.1:{port}/metrics")
+    if textfile:
+        threading.Thread(target=_textfile_loop, args=(textfile, interval), name="metrics-textfile",
+                         daemon=True).start()
+        logging.info(f"Метрики записываются в {textfile} каждые {interval} с")
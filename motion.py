@@ -0,0 +1,66 @@
+import cv2
+import time
+from settings import MOTION_THUMBNAIL_SIZE, MOTION_PIXEL_THRESHOLD, MOTION_MIN_CHANGED, MOTION_LEARNING_RATE, \
+    MOTION_ACTIVE_HOLD
+
+
+class MotionGate:
+    """Дешевый предварительный этап: сравнение миниатюры кадра с фоновой моделью.
+
+    Полный детектор запускается, только если в кадре есть движение
+    или лицо было найдено недавно (в пределах active_hold секунд).
+    clock — источник времени; при воспроизведении ролика это время ролика.
+    """
+
+    def __init__(self, size=MOTION_THUMBNAIL_SIZE, pixel_threshold=MOTION_PIXEL_THRESHOLD,
+                 min_changed=MOTION_MIN_CHANGED, learning_rate=MOTION_LEARNING_RATE, active_hold=MOTION_ACTIVE_HOLD,
+                 clock=time.monotonic):
+        self.size = size
+        self.pixel_threshold = pixel_threshold
+        self.min_changed = min_changed
+        self.learning_rate = learning_rate
+        self.active_hold = active_hold
+        self.clock = clock
+        self._background = None
+        self._last_active = None
+        self.frames_checked = 0
+        self.frames_gated = 0
+
+    @property
+    def active(self):
+        """Было ли движение или лицо за последние active_hold секунд."""
+        return self._last_active is not None and self.clock() - self._last_active < self.active_hold
+
+    def has_motion(self, frame):
+        """Доля изменившихся пикселей миниатюры относительно фона превышает порог."""
+        thumbnail = cv2.resize(frame, self.size, interpolation=cv2.INTER_NEAREST)
+        if thumbnail.ndim == 3:
+            thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+        thumbnail = cv2.GaussianBlur(thumbnail, (3, 3), 0)
+
+        if self._background is None:
+            self._background = thumbnail.astype("float32")
+            return True
+
+        diff = cv2.absdiff(thumbnail, cv2.convertScaleAbs(self._background))
+        _, mask = cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY)
+        cv2.accumulateWeighted(thumbnail, self._background, self.learning_rate)
+        return cv2.countNonZero(mask) / mask.size >= self.min_changed
+
+    def should_detect(self, frame):
+        """Нужно ли запускать полный детектор на этом кадре."""
+        self.frames_checked += 1
+        if self.has_motion(frame):
+            self._last_active = self.clock()
+            return True
+        if self.active:
+            return True
+        self.frames_gated += 1
+        return False
+
+    def mark_face(self):
+        """Лицо в кадре продлевает активный режим, даже если человек стоит неподвижно."""
+        self._last_active = self.clock()
+
+    def stats(self):
+        return {"checked": self.frames_checked, "gated": self.frames_gated}
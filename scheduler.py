@@ -0,0 +1,62 @@
+import asyncio
+import time
+from settings import UI_TARGET_FPS
+
+
+class FrameScheduler:
+    """Общий планировщик кадров интерфейса с фиксированной частотой.
+
+    Срок следующего кадра отсчитывается от срока предыдущего, а не от
+    момента окончания отрисовки, поэтому время отрисовки не накапливается
+    в дрейф. Если отставание превысило период, расписание сдвигается на
+    текущий момент (кадры пропускаются, а не догоняются пачкой). Между
+    кадрами цикл событий свободен для камеры, сети и фоновых задач.
+    """
+
+    def __init__(self, fps=UI_TARGET_FPS):
+        self.period = 1 / fps
+        self._deadline = None
+        self.frames = 0
+        self.late_frames = 0
+        # Процессорное время потока интерфейса между кадрами (без ожидания)
+        self._cpu_mark = None
+        self._cpu_time = 0.0
+        self._cpu_frames = 0
+
+    def reset(self):
+        """Начать расписание заново (например, при смене экрана после паузы)."""
+        self._deadline = None
+
+    async def next_frame(self, wake=None):
+        """Дождаться срока следующего кадра или, раньше него, завершения задачи wake."""
+        if self._cpu_mark is not None:
+            self._cpu_time += time.thread_time() - self._cpu_mark
+            self._cpu_frames += 1
+        now = time.monotonic()
+        if self._deadline is None:
+            self._deadline = now + self.period
+        else:
+            self._deadline += self.period
+            if now - self._deadline > self.period:
+                self.late_frames += 1
+                self._deadline = now + self.period
+        delay = max(0.0, self._deadline - time.monotonic())
+        if wake is not None:
+            await asyncio.wait({wake}, timeout=delay)
+        else:
+            await asyncio.sleep(delay)
+        self.frames += 1
+        self._cpu_mark = time.thread_time()
+
+    def stats(self):
+        """Среднее процессорное время потока интерфейса на кадр с момента предыдущего вызова."""
+        cpu_ms = self._cpu_time / self._cpu_frames * 1000 if self._cpu_frames else 0.0
+        result = {"frames": self._cpu_frames, "cpu_ms_per_frame": cpu_ms, "late_frames": self.late_frames}
+        self._cpu_time = 0.0
+        self._cpu_frames = 0
+        self.late_frames = 0
+        return result
+
+
+# Общий планировщик для всех экранов
+ui_scheduler = FrameScheduler()
@@ -0,0 +1,200 @@
+"""Параметры подсистем со значениями по умолчанию.
+
+Значение берется из config.py, если оно там задано, иначе используется
+значение по умолчанию ниже. Так новые параметры не ломают существующие
+локальные конфигурации.
+"""
+import os
+import tempfile
+
+import config
+
+
+def _get(name, default):
+    return getattr(config, name, default)
+
+
+# Фоновый захват кадров
+# Кадр старше этого возраста (сек) считается устаревшим и не отдается на детекцию
+CAPTURE_MAX_FRAME_AGE = _get("CAPTURE_MAX_FRAME_AGE", 0.5)
+
+# Сессия камеры и переподключение
+# Число подряд неудачных чтений, после которого камера переоткрывается
+CAMERA_MAX_READ_FAILURES = _get("CAMERA_MAX_READ_FAILURES", 50)
+# Если новых кадров нет дольше этого времени (сек), поток считается зависшим
+CAMERA_STALL_TIMEOUT = _get("CAMERA_STALL_TIMEOUT", 5.0)
+# Начальная и максимальная пауза (сек) между попытками переподключения
+CAMERA_RECONNECT_BACKOFF = _get("CAMERA_RECONNECT_BACKOFF", 1.0)
+CAMERA_RECONNECT_BACKOFF_MAX = _get("CAMERA_RECONNECT_BACKOFF_MAX", 30.0)
+
+# Детектор лиц
+# Бэкенд детектора: "haar", "lbp" или "dnn"
+DETECTOR_BACKEND = _get("DETECTOR_BACKEND", "haar")
+HAAR_CASCADE_FILE = _get("HAAR_CASCADE_FILE", "haarcascade_frontalface_alt.xml")
+LBP_CASCADE_PATH = _get("LBP_CASCADE_PATH", "models/lbpcascade_frontalface_improved.xml")
+# Модель cv2.dnn (по умолчанию res10 SSD в формате Caffe) и порог уверенности
+DNN_MODEL_PATH = _get("DNN_MODEL_PATH", "models/res10_300x300_ssd_iter_140000.caffemodel")
+DNN_CONFIG_PATH = _get("DNN_CONFIG_PATH", "models/deploy.prototxt")
+DNN_CONFIDENCE = _get("DNN_CONFIDENCE", 0.6)
+# Границы размера лица для каскадов выводятся из MIN_AREA_PERCENT и ANALYSIS_SIZE:
+# уровни пирамиды, на которых лицо заведомо меньше порога, не просматриваются
+DETECTOR_SIZE_PRUNING = _get("DETECTOR_SIZE_PRUNING", True)
+# Запас для пограничных лиц: minSize = сторона порогового лица * запас
+DETECTOR_MIN_SIZE_MARGIN = _get("DETECTOR_MIN_SIZE_MARGIN", 0.8)
+# Поиск на уменьшенном кадре, в котором наименьшее допустимое лицо имеет эту сторону (пиксели);
+# None — без уменьшения
+DETECTOR_SEARCH_MIN_FACE = _get("DETECTOR_SEARCH_MIN_FACE", 40)
+
+# Предварительный детектор движения
+MOTION_GATE_ENABLED = _get("MOTION_GATE_ENABLED", True)
+# Размер миниатюры для сравнения с фоном
+MOTION_THUMBNAIL_SIZE = _get("MOTION_THUMBNAIL_SIZE", (80, 60))
+# Порог разницы яркости пикселя и доля изменившихся пикселей, при которых считается, что есть движение
+MOTION_PIXEL_THRESHOLD = _get("MOTION_PIXEL_THRESHOLD", 25)
+MOTION_MIN_CHANGED = _get("MOTION_MIN_CHANGED", 0.01)
+# Скорость обновления фоновой модели (0..1)
+MOTION_LEARNING_RATE = _get("MOTION_LEARNING_RATE", 0.05)
+# Сколько секунд после движения или лица детектор продолжает работать на каждом кадре
+MOTION_ACTIVE_HOLD = _get("MOTION_ACTIVE_HOLD", 2.0)
+# Пропуск кадров в простое (в активном режиме используется FRAME_SKIP)
+MOTION_IDLE_FRAME_SKIP = _get("MOTION_IDLE_FRAME_SKIP", config.FRAME_SKIP * 4)
+
+# Сопровождение лица между детекциями
+TRACKING_ENABLED = _get("TRACKING_ENABLED", True)
+# Запас вокруг последней рамки (доля ее размера с каждой стороны) для поиска и перепроверки
+TRACKER_SEARCH_MARGIN = _get("TRACKER_SEARCH_MARGIN", 0.5)
+# Минимальная корреляция шаблона, при которой лицо считается найденным
+TRACKER_MIN_SCORE = _get("TRACKER_MIN_SCORE", 0.6)
+# Каждый N-й кадр сопровождения перепроверяется детектором внутри ROI
+TRACKER_VERIFY_INTERVAL = _get("TRACKER_VERIFY_INTERVAL", 5)
+# Сколько промахов подряд допускается до потери трека
+TRACKER_MAX_MISSES = _get("TRACKER_MAX_MISSES", 3)
+
+# Подготовка кадра к детекции
+# Разрешение кадра анализа (ширина, высота)
+ANALYSIS_SIZE = _get("ANALYSIS_SIZE", (640, 480))
+# Выравнивание гистограммы для слабого освещения: "off", "on" или "auto"
+ANALYSIS_EQUALIZE = _get("ANALYSIS_EQUALIZE", "off")
+# В режиме "auto" выравнивание включается, если средняя яркость ниже порога
+ANALYSIS_LOW_LIGHT_MEAN = _get("ANALYSIS_LOW_LIGHT_MEAN", 60)
+
+# Несколько камер
+# Список источников для многокамерного режима; None — одна камера config.CAMERA_SOURCE
+CAMERA_SOURCES = _get("CAMERA_SOURCES", None)
+
+# Снимок высокого разрешения
+# Основной поток IP-камеры для снимка; config.CAMERA_SOURCE при этом — дешевый подпоток для детекции.
+# Открывается только на время отсчета PHOTO_DELAY. None — снимок из потока детекции
+CAMERA_PHOTO_SOURCE = _get("CAMERA_PHOTO_SOURCE", None)
+# То же для многокамерного режима: список в порядке CAMERA_SOURCES (None — без основного потока)
+CAMERA_PHOTO_SOURCES = _get("CAMERA_PHOTO_SOURCES", None)
+# Разрешение детекции локальной камеры (ширина, высота); снимок делается в config.PHOTO_RESOLUTION.
+# None — камера работает в разрешении по умолчанию, снимок из потока детекции
+CAMERA_DETECT_RESOLUTION = _get("CAMERA_DETECT_RESOLUTION", None)
+# Кадры, пропускаемые после переключения разрешения локальной камеры (подстройка экспозиции)
+PHOTO_SETTLE_FRAMES = _get("PHOTO_SETTLE_FRAMES", 3)
+# Сколько ждать кадр основного потока при снимке (секунды), затем снимок из потока детекции
+PHOTO_STREAM_TIMEOUT = _get("PHOTO_STREAM_TIMEOUT", 3.0)
+# Через сколько секунд после потери лица основной поток закрывается
+PHOTO_STREAM_HOLD = _get("PHOTO_STREAM_HOLD", 3.0)
+
+# Выбор лучшего кадра за время отсчета
+# Снимок — лучший кадр отсчета, а не последний (смаз, моргание)
+BEST_FRAME_ENABLED = _get("BEST_FRAME_ENABLED", True)
+# Окно выбора (секунды) и число слотов: каждый хранит лучший кадр своего интервала окна
+BEST_FRAME_WINDOW = _get("BEST_FRAME_WINDOW", config.PHOTO_DELAY)
+BEST_FRAME_SLOTS = _get("BEST_FRAME_SLOTS", 6)
+# Веса резкости, размера и центрированности лица в оценке кадра
+BEST_FRAME_WEIGHTS = _get("BEST_FRAME_WEIGHTS", (0.6, 0.25, 0.15))
+# Дисперсия лапласиана, при которой вклад резкости равен половине веса
+BEST_FRAME_SHARPNESS_REF = _get("BEST_FRAME_SHARPNESS_REF", 100.0)
+# Доля кадра, начиная с которой размер лица дает полный вклад
+BEST_FRAME_SIZE_REF = _get("BEST_FRAME_SIZE_REF", 0.2)
+# Размер, к которому приводится лицо для оценки резкости, и отступ от краев рамки (доля ее размера)
+BEST_FRAME_ROI_SIZE = _get("BEST_FRAME_ROI_SIZE", (64, 64))
+BEST_FRAME_ROI_INSET = _get("BEST_FRAME_ROI_INSET", 0.15)
+
+# Кэш досье по сигнатуре лица
+# Повторный снимок того же посетителя показывает сохраненное досье без запроса к API.
+# По умолчанию выключен: похожие лица разных посетителей могут получить чужое досье
+DOSSIER_CACHE_ENABLED = _get("DOSSIER_CACHE_ENABLED", False)
+# Время жизни записи (секунды) и число хранимых лиц
+DOSSIER_CACHE_TTL = _get("DOSSIER_CACHE_TTL", 300)
+DOSSIER_CACHE_MAX_ENTRIES = _get("DOSSIER_CACHE_MAX_ENTRIES", 32)
+# Наибольшее расстояние Хэмминга между 64-битными сигнатурами, при котором лицо считается тем же.
+# Большее значение дает больше попаданий, но и риск показать чужое досье
+DOSSIER_CACHE_MAX_DISTANCE = _get("DOSSIER_CACHE_MAX_DISTANCE", 6)
+
+# Передача снимка
+# Формат и качество снимка для отправки в API: "jpeg", "webp" или "png"
+PHOTO_UPLOAD_FORMAT = _get("PHOTO_UPLOAD_FORMAT", "jpeg")
+PHOTO_UPLOAD_QUALITY = _get("PHOTO_UPLOAD_QUALITY", 90)
+# Ограничение большей стороны снимка для отправки (пиксели)
+PHOTO_UPLOAD_MAX_SIDE = _get("PHOTO_UPLOAD_MAX_SIDE", 1280)
+# Каталог для файла отправки; /dev/shm хранит его в памяти
+PHOTO_UPLOAD_DIR = _get("PHOTO_UPLOAD_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+# Отладка: дополнительно сохранять полноразмерный PNG в config.PHOTO_PATH
+PHOTO_DEBUG_SAVE = _get("PHOTO_DEBUG_SAVE", False)
+
+# Упреждающая отправка снимка во время отсчета
+SPECULATIVE_SUBMIT = _get("SPECULATIVE_SUBMIT", True)
+# Доля PHOTO_DELAY, после которой текущий кадр уходит в API в фоне
+SPECULATIVE_START_FRACTION = _get("SPECULATIVE_START_FRACTION", 0.5)
+# Во сколько раз должна вырасти площадь лица, чтобы отправить кадр заново
+SPECULATIVE_BETTER_RATIO = _get("SPECULATIVE_BETTER_RATIO", 1.3)
+# На сколько оценка итогового снимка (frame_score, от 0 до 1) должна превышать оценку
+# упреждающего кадра, чтобы запрос был отменен и отправлен итоговый снимок
+SPECULATIVE_BETTER_SCORE = _get("SPECULATIVE_BETTER_SCORE", 0.05)
+
+# Интерфейс
+# Целевая частота кадров всех экранов
+UI_TARGET_FPS = _get("UI_TARGET_FPS", 50)
+
+# Озвучивание
+# Бэкенд синтеза: "gtts", "stub" или "модуль:Класс" для своего движка
+TTS_BACKEND = _get("TTS_BACKEND", "gtts")
+TTS_LANG = _get("TTS_LANG", "ru")
+TTS_TLD = _get("TTS_TLD", "ru")
+# Число параллельно синтезируемых предложений
+TTS_WORKERS = _get("TTS_WORKERS", 3)
+# Кэш синтезированной речи на диске и его предельный размер (байты)
+TTS_CACHE_DIR = _get("TTS_CACHE_DIR", os.path.join(os.path.dirname(config.AUDIO_PATH), "tts_cache"))
+TTS_CACHE_MAX_BYTES = _get("TTS_CACHE_MAX_BYTES", 200 * 1024 * 1024)
+
+# Звук
+# Параметры микшера; gTTS выдает моно 24 кГц, поэтому пересчет частоты не нужен
+AUDIO_FREQUENCY = _get("AUDIO_FREQUENCY", 24000)
+AUDIO_CHANNELS = _get("AUDIO_CHANNELS", 1)
+# Размер буфера устройства (сэмплы): меньше — ниже задержка, но выше риск щелчков
+AUDIO_BUFFER = _get("AUDIO_BUFFER", 512)
+
+# Метрики
+METRICS_ENABLED = _get("METRICS_ENABLED", True)
+# Порт HTTP /metrics на 127.0.0.1 для Prometheus; None — не открывать
+METRICS_HTTP_PORT = _get("METRICS_HTTP_PORT", 9108)
+# Файл для textfile collector node_exporter (*.prom); None — не писать
+METRICS_TEXTFILE = _get("METRICS_TEXTFILE", None)
+METRICS_TEXTFILE_INTERVAL = _get("METRICS_TEXTFILE_INTERVAL", 15)
+
+# Журнал
+LOG_LEVEL = _get("LOG_LEVEL", "INFO")
+LOG_FILE = _get("LOG_FILE", "app.log")
+# Ротация: предельный размер файла (байты) и число старых файлов
+LOG_MAX_BYTES = _get("LOG_MAX_BYTES", 10 * 1024 * 1024)
+LOG_BACKUP_COUNT = _get("LOG_BACKUP_COUNT", 5)
+# Не больше LOG_RATE_LIMIT сообщений с одной строки кода за LOG_RATE_INTERVAL секунд (0 — без ограничения)
+LOG_RATE_LIMIT = _get("LOG_RATE_LIMIT", 5)
+LOG_RATE_INTERVAL = _get("LOG_RATE_INTERVAL", 10.0)
+
+# Отдельный процесс захвата и детекции
+# Захват и детекция в дочернем процессе, кадры передаются через общую память
+MULTIPROCESS_ENABLED = _get("MULTIPROCESS_ENABLED", False)
+# Число слотов кольцевого буфера
+FRAME_RING_SLOTS = _get("FRAME_RING_SLOTS", 8)
+# Размер слота (байты): кадр BGR наибольшего из разрешений снимка и детекции, не меньше 1080p.
+# Кадр, который все же не помещается (например, основной поток 4K), уменьшается перед записью
+FRAME_RING_SLOT_BYTES = _get("FRAME_RING_SLOT_BYTES", max(
+    width * height for width, height in ((1920, 1080), config.PHOTO_RESOLUTION, CAMERA_DETECT_RESOLUTION or (0, 0))
+) * 3)
+# Период отправки статистики процесса захвата (секунды)
+VISION_STATS_INTERVAL = _get("VISION_STATS_INTERVAL", 5.0)
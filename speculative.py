@@ -0,0 +1,94 @@
+import logging
+from best_frame import frame_score
+from settings import SPECULATIVE_START_FRACTION, SPECULATIVE_BETTER_RATIO, SPECULATIVE_BETTER_SCORE
+
+
+class SpeculativeSubmission:
+    """Упреждающая отправка снимка в API, пока идет отсчет PHOTO_DELAY.
+
+    Когда лицо стабильно держится start_fraction от задержки, текущий кадр
+    отправляется в фоне. Если лицо потеряно, запрос отменяется; если пришел
+    кадр с заметно большим лицом, запрос перезапускается. По окончании
+    отсчета уже идущий запрос забирается через take(), если снимок сделан
+    той же камерой и итоговый снимок (лучший кадр отсчета) не заметно лучше
+    отправленного.
+    """
+
+    def __init__(self, submit, start_fraction=SPECULATIVE_START_FRACTION, better_ratio=SPECULATIVE_BETTER_RATIO,
+                 better_score=SPECULATIVE_BETTER_SCORE):
+        # submit(кадр, метка, рамка) -> уже запущенный запрос с методом cancel()
+        self._submit = submit
+        self.start_fraction = start_fraction
+        self.better_ratio = better_ratio
+        self.better_score = better_score
+        self.request = None
+        self.frame = None
+        self.face = None
+        self.source = None
+        self._area = 0
+        self.submitted = 0
+        self.cancelled = 0
+
+    def candidate(self, source, frame, face, progress):
+        """Обработка кадра отсчета; frame=None означает, что лицо потеряно."""
+        if frame is None:
+            if self.request is not None and source == self.source:
+                self._cancel("лицо потеряно")
+            return
+        if progress < self.start_fraction:
+            return
+
+        area = face[2] * face[3]
+        if self.request is not None:
+            if source != self.source or area < self._area * self.better_ratio:
+                return
+            self._cancel("найден лучший кадр")
+
+        # Кадр может быть общим (представление кольцевого буфера процесса захвата):
+        # копия делается только для отправляемого кадра
+        frame = frame.copy()
+        self.submitted += 1
+        self.request = self._submit(frame, f"_spec{self.submitted}", face)
+        self.frame = frame
+        self.face = face
+        self.source = source
+        self._area = area
+        logging.info(f"Упреждающая отправка снимка с камеры {source}, доля отсчета {progress:.2f}")
+
+    def _cancel(self, reason):
+        self.request.cancel()
+        self.cancelled += 1
+        logging.info(f"Упреждающий запрос отменен: {reason}")
+        self.request = None
+        self.frame = None
+        self.face = None
+        self.source = None
+        self._area = 0
+
+    def take(self, source, photo=None, face=None):
+        """Забрать идущий запрос и его кадр: (запрос, кадр) или (None, None).
+
+        Запрос с другой камеры (снимок сделала не она) отменяется: посетитель
+        у другого входа не должен увидеть чужое фото и досье. Отменяется он и
+        тогда, когда итоговый снимок photo с рамкой face оценен заметно выше
+        отправленного кадра: лучший кадр второй половины отсчета важнее
+        выигрыша во времени.
+        """
+        if self.request is not None and self.source != source:
+            self._cancel(f"снимок сделан другой камерой ({source})")
+        if self.request is not None and photo is not None and photo is not self.frame:
+            final_score, _ = frame_score(photo, face)
+            sent_score, _ = frame_score(self.frame, self.face)
+            if final_score - sent_score > self.better_score:
+                self._cancel(f"итоговый снимок лучше ({final_score:.2f} против {sent_score:.2f})")
+        request, frame = self.request, self.frame
+        self.request = None
+        self.frame = None
+        self.face = None
+        self.source = None
+        self._area = 0
+        return request, frame
+
+    def cancel(self):
+        if self.request is not None:
+            self._cancel("захват прерван")
@@ -0,0 +1,34 @@
+import pygame
+
+BLACK = (0, 0, 0)
+
+
+class SpriteCache:
+    """Заранее отрисованные кадры анимации.
+
+    Кадр рисуется процедурной функцией один раз при первом обращении и
+    дальше только копируется на экран. Значение анимации (угол, прогресс)
+    квантуется до steps кадров на полный цикл.
+    """
+
+    def __init__(self, size, draw, steps):
+        # draw(поверхность, центр, доля цикла 0..1) рисует кадр
+        self.size = size
+        self.draw = draw
+        self.steps = steps
+        self._frames = {}
+
+    def frame(self, fraction):
+        index = int(round(fraction * self.steps)) % (self.steps + 1)
+        sprite = self._frames.get(index)
+        if sprite is None:
+            sprite = pygame.Surface(self.size).convert()
+            sprite.fill(BLACK)
+            self.draw(sprite, (self.size[0] // 2, self.size[1] // 2), index / self.steps)
+            self._frames[index] = sprite
+        return sprite
+
+    def blit(self, screen, center, fraction):
+        """Вывод кадра по центру; возвращает занятый прямоугольник для display.update."""
+        sprite = self.frame(fraction)
+        return screen.blit(sprite, sprite.get_rect(center=center))
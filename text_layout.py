@@ -0,0 +1,107 @@
+from collections import OrderedDict
+import metrics
+
+WHITE = (255, 255, 255)
+
+
+class TextLayout:
+    """Раскладка текста без растеризации.
+
+    Ширина слов измеряется через font.size и кэшируется для каждого шрифта,
+    строки переносятся за один проход. Готовые строки растеризуются один раз
+    и хранятся в LRU-кэше по ключу (шрифт, текст, цвет).
+    """
+
+    def __init__(self, max_surfaces=512, max_words=8192):
+        self.max_surfaces = max_surfaces
+        self.max_words = max_words
+        self._widths = {}
+        self._surfaces = OrderedDict()
+        self.surface_hits = 0
+        self.surface_misses = 0
+
+    def _word_widths(self, font):
+        widths = self._widths.get(font)
+        if widths is None or len(widths) > self.max_words:
+            widths = {" ": font.size(" ")[0]}
+            self._widths[font] = widths
+        return widths
+
+    def measure(self, font, word):
+        """Ширина слова в пикселях (из кэша)."""
+        widths = self._word_widths(font)
+        width = widths.get(word)
+        if width is None:
+            width = font.size(word)[0]
+            widths[word] = width
+        return width
+
+    def wrap_lines(self, text, font, max_width):
+        """Перенос текста по словам; пустые строки абзацев сохраняются как ""."""
+        with metrics.TEXT_LAYOUT.time():
+            return self._wrap_lines(text, font, max_width)
+
+    def _wrap_lines(self, text, font, max_width):
+        widths = self._word_widths(font)
+        space = widths[" "]
+        lines = []
+        for paragraph in text.split("\n"):
+            if not paragraph:
+                lines.append("")
+                continue
+            line = []
+            line_width = 0
+            for word in paragraph.split(" "):
+                if not word:
+                    continue
+                width = widths.get(word)
+                if width is None:
+                    width = font.size(word)[0]
+                    widths[word] = width
+                candidate = line_width + space + width if line else width
+                if candidate <= max_width or not line:
+                    line.append(word)
+                    line_width = candidate
+                else:
+                    lines.extend(self._fit(line, font, max_width))
+                    line = [word]
+                    line_width = width
+            if line:
+                lines.extend(self._fit(line, font, max_width))
+            else:
+                lines.append("")
+        return lines
+
+    def _fit(self, words, font, max_width):
+        # Сумма ширин слов не учитывает кернинг на стыках; итоговая строка
+        # проверяется одним font.size, при переполнении хвост переносится дальше
+        overflow = []
+        while len(words) > 1 and font.size(" ".join(words))[0] > max_width:
+            overflow.insert(0, words.pop())
+        lines = [" ".join(words)]
+        if overflow:
+            lines.extend(self._fit(overflow, font, max_width))
+        return lines
+
+    def render(self, font, text, color=WHITE):
+        """Поверхность строки из кэша; растеризуется только при первом обращении."""
+        key = (font, text, color)
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self._surfaces.move_to_end(key)
+            self.surface_hits += 1
+            return surface
+        self.surface_misses += 1
+        surface = font.render(text, True, color)
+        self._surfaces[key] = surface
+        if len(self._surfaces) > self.max_surfaces:
+            self._surfaces.popitem(last=False)
+        return surface
+
+    def wrap(self, text, font, max_width, color=WHITE):
+        """Поверхности строк после переноса; None — пустая строка."""
+        return [self.render(font, line, color) if line else None for line in self.wrap_lines(text, font, max_width)]
+
+
+# Общий экземпляр для всех экранов
+layout_engine = TextLayout()
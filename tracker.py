@@ -0,0 +1,85 @@
+import cv2
+import logging
+from settings import TRACKER_SEARCH_MARGIN, TRACKER_MIN_SCORE, TRACKER_VERIFY_INTERVAL, TRACKER_MAX_MISSES
+
+
+class FaceTracker:
+    """Сопровождение лица между детекциями.
+
+    Между перепроверками лицо ищется сопоставлением шаблона в расширенной
+    области вокруг последней рамки; раз в verify_interval кадров детектор
+    запускается только внутри этой области. Трек теряется после
+    max_misses промахов подряд — тогда возвращается полнокадровая детекция.
+    Все координаты — в системе кадра анализа.
+    """
+
+    def __init__(self, search_margin=TRACKER_SEARCH_MARGIN, min_score=TRACKER_MIN_SCORE,
+                 verify_interval=TRACKER_VERIFY_INTERVAL, max_misses=TRACKER_MAX_MISSES):
+        self.search_margin = search_margin
+        self.min_score = min_score
+        self.verify_interval = verify_interval
+        self.max_misses = max_misses
+        self.box = None
+        self._template = None
+        self._frames_since_verify = 0
+        self._misses = 0
+
+    @property
+    def tracking(self):
+        return self.box is not None
+
+    def start(self, gray, box):
+        """Начало сопровождения с рамки, найденной детектором."""
+        x, y, w, h = box
+        self.box = box
+        self._template = gray[y:y + h, x:x + w].copy()
+        self._frames_since_verify = 0
+        self._misses = 0
+
+    def reset(self):
+        self.box = None
+        self._template = None
+
+    def _search_area(self, shape):
+        x, y, w, h = self.box
+        margin_x = int(w * self.search_margin)
+        margin_y = int(h * self.search_margin)
+        x0, y0 = max(0, x - margin_x), max(0, y - margin_y)
+        x1, y1 = min(shape[1], x + w + margin_x), min(shape[0], y + h + margin_y)
+        return x0, y0, x1, y1
+
+    def _miss(self):
+        self._misses += 1
+        if self._misses >= self.max_misses:
+            logging.info("Трек лица потерян")
+            self.reset()
+            return None
+        # Кратковременный промах: держим последнюю рамку
+        return self.box
+
+    def update(self, gray, detector):
+        """Новое положение лица или None, если трек потерян."""
+        x0, y0, x1, y1 = self._search_area(gray.shape)
+        roi = gray[y0:y1, x0:x1]
+
+        self._frames_since_verify += 1
+        if self._frames_since_verify >= self.verify_interval:
+            self._frames_since_verify = 0
+            faces = detector.detect(roi)
+            if len(faces) == 0:
+                return self._miss()
+            fx, fy, fw, fh = max(faces, key=lambda f: f[2] * f[3])
+            self.start(gray, (fx + x0, fy + y0, fw, fh))
+            return self.box
+
+        th, tw = self._template.shape[:2]
+        if roi.shape[0] < th or roi.shape[1] < tw:
+            return self._miss()
+        result = cv2.matchTemplate(roi, self._template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, location = cv2.minMaxLoc(result)
+        if score < self.min_score:
+            return self._miss()
+
+        self._misses = 0
+        self.box = (location[0] + x0, location[1] + y0, tw, th)
+        return self.box
@@ -0,0 +1,223 @@
+import hashlib
+import importlib
+import io
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+from settings import TTS_BACKEND, TTS_LANG, TTS_TLD, TTS_WORKERS, TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES
+
+# Граница предложения: пробел после конца предложения или перевод строки
+_SENTENCE_END = re.compile(r'(?<=[.!?…])\s+|\n+')
+
+
+def split_sentences(text):
+    """Разбиение текста на предложения для синтеза по частям."""
+    return [sentence.strip() for sentence in _SENTENCE_END.split(text) if sentence.strip()]
+
+
+class GTTSBackend:
+    """Синтез через gTTS (сетевой запрос к Google)."""
+
+    name = "gtts"
+    extension = ".mp3"
+
+    def __init__(self, lang=TTS_LANG, tld=TTS_TLD):
+        self.lang = lang
+        self.tld = tld
+        self.voice = f"{lang}-{tld}"
+
+    def synthesize(self, text):
+        from gtts import gTTS
+
+        buffer = io.BytesIO()
+        gTTS(text=text, lang=self.lang, tld=self.tld).write_to_fp(buffer)
+        return buffer.getvalue()
+
+
+class StubBackend:
+    """Заглушка для тестов и отладки: возвращает заданные байты без сети."""
+
+    name = "stub"
+    voice = ""
+    extension = ".wav"
+
+    def __init__(self, payload=b"", delay=0.0):
+        self.payload = payload
+        self.delay = delay
+
+    def synthesize(self, text):
+        if self.delay:
+            time.sleep(self.delay)
+        return self.payload
+
+
+BACKENDS = {
+    GTTSBackend.name: GTTSBackend,
+    StubBackend.name: StubBackend,
+}
+
+
+def load_backend(spec=TTS_BACKEND):
+    """Бэкенд по имени или по пути "модуль:Класс" для своего (например, офлайн) движка."""
+    if spec in BACKENDS:
+        return BACKENDS[spec]()
+    module_name, _, class_name = spec.partition(":")
+    if not class_name:
+        raise Exception(f"Неизвестный бэкенд синтеза речи: {spec}")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+class SpeechCache:
+    """Кэш синтезированной речи на диске по хэшу содержимого с вытеснением давно неиспользованного (LRU).
+
+    Порядок использования хранится в памяти и в mtime файлов, поэтому
+    переживает перезапуск.
+    """
+
+    def __init__(self, directory=TTS_CACHE_DIR, max_bytes=TTS_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if not name.endswith(".tmp") and os.path.isfile(path):
+                stat = os.stat(path)
+                files.append((stat.st_mtime, name, stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self.total_bytes += size
+
+    @staticmethod
+    def key(backend, text):
+        """Имя файла кэша: хэш бэкенда, голоса и текста с расширением формата бэкенда."""
+        digest = hashlib.sha256(f"{backend.name}|{backend.voice}|{text}".encode("utf-8")).hexdigest()
+        return f"{digest}{backend.extension}"
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """Путь к закэшированной речи или None."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                metrics.TTS_CACHE_MISSES.inc()
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            metrics.TTS_CACHE_HITS.inc()
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.total_bytes -= self._entries.pop(key, 0)
+            return None
+        return path
+
+    def put(self, key, data):
+        """Сохранение речи в кэш; при превышении размера удаляются самые старые записи."""
+        path = self.path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.total_bytes += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            evicted = []
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, size = self._entries.popitem(last=False)
+                self.total_bytes -= size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self.path(old_key))
+            except OSError:
+                pass
+        return path
+
+
+class SpeechSynthesizer:
+    """Параллельный синтез предложений в пуле потоков с кэшем перед бэкендом."""
+
+    def __init__(self, backend=None, cache=None, workers=TTS_WORKERS):
+        self.backend = backend if backend is not None else load_backend()
+        self.cache = cache if cache is not None else SpeechCache()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts")
+
+    def submit(self, sentence, decode=None):
+        """Future с байтами речи для предложения; decode(байты) выполняется в том же рабочем потоке."""
+        return self._executor.submit(self._synthesize, sentence, decode)
+
+    def _synthesize(self, sentence, decode):
+        key = self.cache.key(self.backend, sentence)
+        path = self.cache.get(key)
+        data = None
+        if path is not None:
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                data = None
+        if data is None:
+            start = time.perf_counter()
+            data = self.backend.synthesize(sentence)
+            elapsed = time.perf_counter() - start
+            metrics.TTS_SYNTHESIS.observe(elapsed)
+            logging.info(f"Синтез речи: {len(sentence)} символов за {elapsed:.2f} с")
+            self.cache.put(key, data)
+        return decode(data) if decode is not None else data
+
+
+class SpeechQueue:
+    """Озвучивание одного текста: завершенные предложения отправляются на синтез по мере поступления текста."""
+
+    def __init__(self, synthesizer, decode=None):
+        self.synthesizer = synthesizer
+        self.decode = decode
+        self.segments = []
+        self.complete = False
+        self._consumed = 0
+
+    def feed(self, text, finished):
+        """Отправка на синтез новых завершенных предложений; finished — текст получен целиком."""
+        if self.complete:
+            return
+        end = len(text) if finished else self._consumed
+        if not finished:
+            for match in _SENTENCE_END.finditer(text, self._consumed):
+                end = match.end()
+        if end > self._consumed:
+            for sentence in split_sentences(text[self._consumed:end]):
+                self.segments.append(self.synthesizer.submit(sentence, self.decode))
+            self._consumed = end
+        self.complete = finished
+
+
+_synthesizer = None
+
+
+def use_synthesizer(synthesizer):
+    """Замена общего синтезатора (например, на заглушку в нагрузочном прогоне)."""
+    global _synthesizer
+    _synthesizer = synthesizer
+
+
+def get_synthesizer():
+    """Общий синтезатор: пул потоков и кэш создаются один раз."""
+    global _synthesizer
+    if _synthesizer is None:
+        _synthesizer = SpeechSynthesizer()
+    return _synthesizer
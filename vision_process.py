@@ -0,0 +1,299 @@
+import asyncio
+import logging
+import multiprocessing
+import queue
+import time
+
+import cv2
+
+import camera
+import logging_setup
+import metrics
+from frame_ring import FrameRing
+from settings import FRAME_RING_SLOTS, FRAME_RING_SLOT_BYTES, VISION_STATS_INTERVAL
+
+# Команды процессу захвата: (команда, номер цикла)
+START = "start"  # начать цикл захвата: ждать стабильное лицо
+STOP = "stop"    # прервать цикл, камеры остаются открытыми
+QUIT = "quit"
+
+# События процесса захвата: (вид, time.monotonic() отправки, номер цикла, данные...);
+# по номеру цикла отбрасываются события, отправленные до остановки предыдущего цикла
+CANDIDATE = "candidate"  # кадр с лицом во время отсчета: источник, слот, версия, доля отсчета
+LOST = "lost"            # лицо потеряно: источник
+STABLE = "stable"        # стабильное лицо, снимок сделан: источник, слот, версия (рамка лица — в заголовке слота)
+STATS = "stats"          # статистика процесса: словарь, в нем приращения метрик процесса захвата
+ERROR = "error"          # цикл захвата завершился ошибкой: текст
+
+
+class _CpuMeter:
+    """Доля ядра, занятая процессом (все потоки) с прошлого замера."""
+
+    def __init__(self):
+        self._cpu = time.process_time()
+        self._wall = time.perf_counter()
+
+    def sample(self):
+        cpu, wall = time.process_time(), time.perf_counter()
+        utilization = (cpu - self._cpu) / (wall - self._wall) if wall > self._wall else 0.0
+        self._cpu, self._wall = cpu, wall
+        return utilization
+
+
+class _RateMeter:
+    """FPS анализа и средняя задержка детекции конвейеров с прошлого замера.
+
+    Читает накопительные счетчики FacePipeline.totals и не сбрасывает окно
+    FacePipeline.stats, по которому capture_first пишет свой отчет.
+    """
+
+    def __init__(self, cameras):
+        self._wall = time.perf_counter()
+        self._totals = {pipeline.name: pipeline.totals() for _, pipeline in cameras}
+
+    def sample(self, cameras):
+        wall = time.perf_counter()
+        elapsed = wall - self._wall
+        self._wall = wall
+        result = {}
+        for _, pipeline in cameras:
+            frames, total = pipeline.totals()
+            last_frames, last_total = self._totals[pipeline.name]
+            self._totals[pipeline.name] = (frames, total)
+            frames, total = frames - last_frames, total - last_total
+            result[pipeline.name] = {
+                "fps": frames / elapsed if elapsed > 0 else 0.0,
+                "detect_ms": total / frames * 1000 if frames else 0.0,
+            }
+        return result
+
+
+def run(sources, photo_sources, ring_name, slots, slot_bytes, commands, events, log_queue):
+    """Точка входа дочернего процесса захвата и детекции."""
+    logging_setup.setup_child_logging(log_queue)
+    ring = FrameRing.attach(ring_name, slots, slot_bytes)
+    try:
+        asyncio.run(_serve(sources, photo_sources, ring, commands, events))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ring.close()
+        logging.info("Процесс захвата завершен")
+
+
+# Размеры кадров, об уменьшении которых уже предупреждали
+_fit_warned = set()
+
+
+def _fit(frame, face, slot_bytes):
+    """Уменьшение кадра (и рамки), если он не помещается в слот кольцевого буфера."""
+    if frame.nbytes <= slot_bytes:
+        return frame, face
+    scale = (slot_bytes / frame.nbytes) ** 0.5
+    height, width = frame.shape[:2]
+    size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    if frame.shape not in _fit_warned:
+        _fit_warned.add(frame.shape)
+        logging.warning(f"Кадр {width}x{height} не помещается в слот ({slot_bytes} байт), "
+                        f"уменьшается до {size[0]}x{size[1]}")
+    fitted = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    if face is not None:
+        face = camera.map_box(face, frame.shape, fitted.shape)
+    return fitted, face
+
+
+async def _serve(sources, photo_sources, ring, commands, events):
+    cameras = camera.open_cameras(sources, photo_sources)
+    cpu = _CpuMeter()
+    rates = _RateMeter(cameras)
+    # Детекция, чтение кадров, переподключения считаются в реестре этого процесса;
+    # экспортирует метрики процесс интерфейса, поэтому приращения уходят ему в STATS
+    exported = {}
+    last_stats = time.perf_counter()
+    task = None
+    cycle_id = None
+
+    def publish(kind, *payload):
+        events.put((kind, time.monotonic(), cycle_id) + payload)
+
+    def on_candidate(source, frame, face, progress):
+        if frame is None:
+            publish(LOST, source)
+            return
+        slot, seq = ring.write(*_fit(frame, face, ring.slot_bytes))
+        publish(CANDIDATE, source, slot, seq, progress)
+
+    async def cycle():
+        photo = None
+        while photo is None:
+            photo = await camera.capture_first(cameras, on_candidate)
+        frame, face, source = photo
+        slot, seq = ring.write(*_fit(frame, face, ring.slot_bytes))
+        publish(STABLE, source, slot, seq)
+
+    try:
+        while True:
+            try:
+                command, number = await asyncio.to_thread(commands.get, True, 0.1)
+            except queue.Empty:
+                command, number = None, None
+            if command == QUIT:
+                break
+            if command in (START, STOP) and task is not None:
+                task.cancel()
+                task = None
+            if command == START:
+                cycle_id = number
+                task = asyncio.create_task(cycle())
+            if task is not None and task.done():
+                if not task.cancelled() and task.exception() is not None:
+                    logging.error(f"Ошибка цикла захвата: {str(task.exception())}")
+                    # Иначе процесс интерфейса ждал бы снимка этого цикла бесконечно
+                    publish(ERROR, str(task.exception()))
+                task = None
+
+            now = time.perf_counter()
+            if now - last_stats >= VISION_STATS_INTERVAL:
+                last_stats = now
+                writes = ring.writes
+                changes, exported = metrics.registry.changes(exported)
+                publish(STATS, {
+                    "cpu": cpu.sample(),
+                    "pipelines": rates.sample(cameras),
+                    "ring_writes": writes,
+                    "ring_write_ms": ring.write_time / writes * 1000 if writes else 0.0,
+                    "metrics": changes,
+                })
+    finally:
+        if task is not None:
+            task.cancel()
+        camera.release_cameras(cameras)
+        # Последние приращения: процесс интерфейса забирает их в close
+        changes, exported = metrics.registry.changes(exported)
+        publish(STATS, {"metrics": changes})
+
+
+class VisionProcess:
+    """Захват и детекция в дочернем процессе.
+
+    Кадры передаются через кольцевой буфер в общей памяти, по очередям идут
+    только короткие команды и события со ссылками на слоты. Процесс
+    интерфейса вызывает capture так же, как camera.capture_first.
+    """
+
+    def __init__(self, sources, photo_sources=None, slots=FRAME_RING_SLOTS, slot_bytes=FRAME_RING_SLOT_BYTES):
+        # spawn: дочерний процесс не наследует потоки и состояние SDL/OpenCV родителя
+        context = multiprocessing.get_context("spawn")
+        self.ring = FrameRing.create(slots, slot_bytes)
+        self.commands = context.Queue()
+        self.events = context.Queue()
+        self._log_queue = context.Queue()
+        self.process = context.Process(
+            target=run, name="vision", daemon=True,
+            args=(sources, photo_sources, self.ring.name, slots, slot_bytes, self.commands, self.events, self._log_queue),
+        )
+        self._cpu = _CpuMeter()
+        self._cycle = 0
+
+    def start(self):
+        logging_setup.forward_records(self._log_queue)
+        self.process.start()
+        logging.info(f"Процесс захвата запущен, pid {self.process.pid}")
+        return self
+
+    async def _next_event(self):
+        try:
+            return await asyncio.to_thread(self.events.get, True, 0.1)
+        except queue.Empty:
+            if not self.process.is_alive():
+                raise Exception(f"Процесс захвата завершился с кодом {self.process.exitcode}")
+            return None
+
+    def _read(self, slot, seq, copy=True):
+        with metrics.FRAME_RING_READ.time():
+            frame, face = self.ring.read(slot, seq, copy)
+        if frame is None:
+            metrics.FRAME_RING_OVERWRITTEN.inc()
+        return frame, face
+
+    def _report(self, stats):
+        metrics.registry.merge(stats["metrics"])
+        ui_cpu = self._cpu.sample()
+        metrics.VISION_CPU.set(stats["cpu"])
+        metrics.UI_CPU.set(ui_cpu)
+        metrics.VISION_FPS.set(sum(pipeline["fps"] for pipeline in stats["pipelines"].values()))
+        pipelines = ", ".join(f"{name}: {pipeline['fps']:.1f} FPS, детекция {pipeline['detect_ms']:.1f} мс"
+                              for name, pipeline in stats["pipelines"].items())
+        logging.info(f"Процесс захвата: CPU {stats['cpu'] * 100:.0f}%, {pipelines}, "
+                     f"запись кадра {stats['ring_write_ms']:.2f} мс; процесс интерфейса: CPU {ui_cpu * 100:.0f}%")
+
+    async def capture(self, on_candidate=None):
+        """Ожидание стабильного лица; возвращает копию кадра из общей памяти, рамку лица и камеру.
+
+        Ошибка цикла в процессе захвата поднимается здесь как исключение.
+        """
+        self._cycle += 1
+        self.commands.put((START, self._cycle))
+        try:
+            while True:
+                event = await self._next_event()
+                if event is None:
+                    continue
+                kind, sent, cycle_id = event[:3]
+                if kind == STATS:
+                    self._report(event[3])
+                    continue
+                metrics.VISION_EVENT_LATENCY.observe(time.monotonic() - sent)
+                if cycle_id != self._cycle:
+                    continue
+                if kind == ERROR:
+                    raise Exception(f"Ошибка процесса захвата: {event[3]}")
+                if kind == LOST:
+                    if on_candidate is not None:
+                        on_candidate(event[3], None, None, 0.0)
+                elif kind == CANDIDATE:
+                    if on_candidate is not None:
+                        # Кандидат — представление общей памяти без копирования; копию
+                        # делает только тот, кто кадр сохраняет (упреждающая отправка)
+                        source, slot, seq, progress = event[3:]
+                        frame, face = self._read(slot, seq, copy=False)
+                        if frame is not None:
+                            on_candidate(source, frame, face, progress)
+                            if not self.ring.valid(slot, seq):
+                                # Слот перезаписан во время обработки: сохраненная копия могла
+                                # оказаться испорченной, запрос по ней отменяется, как при потере лица
+                                metrics.FRAME_RING_OVERWRITTEN.inc()
+                                on_candidate(source, None, None, 0.0)
+                elif kind == STABLE:
+                    source, slot, seq = event[3:]
+                    frame, face = self._read(slot, seq)
+                    if frame is not None:
+                        return frame, face, source
+                    # Кадр перезаписан до чтения — начинаем цикл заново
+                    logging.warning("Снимок перезаписан в общей памяти до чтения, повтор захвата")
+                    self._cycle += 1
+                    self.commands.put((START, self._cycle))
+        except asyncio.CancelledError:
+            self.commands.put((STOP, self._cycle))
+            raise
+
+    def close(self):
+        self.commands.put((QUIT, self._cycle))
+        # События вычитываются до выхода процесса: он не завершится, пока не отдаст
+        # буфер очереди, а в последних STATS — еще не учтенные приращения метрик
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            try:
+                event = self.events.get(True, 0.1)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    break
+                continue
+            if event[0] == STATS:
+                metrics.registry.merge(event[3]["metrics"])
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            logging.warning("Процесс захвата не завершился, принудительная остановка")
+            self.process.terminate()
+            self.process.join()
+        self.ring.close()